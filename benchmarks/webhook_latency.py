@@ -0,0 +1,453 @@
+"""
+Webhook-to-Discord latency benchmark.
+
+Starts the webhook app of main.py together with a fake Discord REST API and a
+stub TMDB server, all on localhost so it runs offline, replays the recorded
+payloads in benchmarks/payloads at a fixed rate per source and reports the
+latency from posting a webhook until its message arrives at Discord, the
+throughput and the queue depth over time.
+
+Every replayed payload gets a unique token ('bench-<n>') in its title. The fake
+Discord API looks for these tokens in the embeds it receives, so batched embeds
+and edits of the grouped Sonarr messages are attributed to the right webhook.
+No gateway is needed: the bot only logs in over REST and webhook channels
+resolve to partial channels.
+
+Usage (from the repository root):
+    python benchmarks/webhook_latency.py --rate sonarr=2 --rate radarr=5 --duration 30
+    python benchmarks/webhook_latency.py --grab-window 0 --batch-window 0.2 --max-p95 1.5 --json report.json
+
+The exit code is 1 when an accepted webhook never reached Discord or when the
+p95 latency is above --max-p95, so the script can be used as a CI check.
+"""
+
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from aiohttp import web, ClientSession
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAYLOADS = os.path.join(ROOT, 'benchmarks', 'payloads')
+sys.path.insert(0, ROOT)
+
+SOURCES = ['sonarr', 'radarr', 'plex', 'watchtower']
+DEFAULT_RATES = {'sonarr': 1.0, 'radarr': 1.0, 'plex': 1.0, 'watchtower': 0.2}
+
+# Environment for src/globals.py, set before main is imported so nothing reaches the real services
+BENCH_ENV = {
+    'DISCORD_TOKEN': 'bench.token',
+    'TMDB_API_KEY': 'bench',
+    'CHANNEL_PLEX_CONTENT': '1001',
+    'CHANNEL_PLEX_PLAYING': '1002',
+    'CHANNEL_RADARR_GRABS': '1003',
+    'CHANNEL_SONARR_GRABS': '1004',
+    'CHANNEL_WATCHTOWER': '1005',
+    'CHANNEL_TRAKT_USER': '1006',
+    'CHANNEL_TRAKT_GLOBAL': '1007',
+    'CHANNEL_TRAKT_RATINGS': '1008',
+    'CHANNEL_PLEXTRAKTSYNC': '1009',
+    'CHANNEL_SYSTEM_INFO': '1010',
+    'CHANNEL_ACHIEVEMENTS': '1011',
+    'CHANNEL_MASTERED': '1012',
+    'CHANNEL_RETRO_OVERVIEW': '1013',
+    'RETRO_TARGET_USERNAMES': 'bench',
+}
+
+BOT_USER = {
+    'id': '900000000000000000',
+    'username': 'ServerBot',
+    'discriminator': '0000',
+    'global_name': None,
+    'avatar': None,
+    'bot': True,
+    'flags': 0,
+}
+
+APPLICATION = {
+    'id': BOT_USER['id'],
+    'name': 'ServerBot',
+    'description': '',
+    'icon': None,
+    'bot_public': False,
+    'bot_require_code_grant': False,
+    'owner': {**BOT_USER, 'id': '900000000000000001', 'username': 'owner', 'bot': False},
+    'verify_key': '',
+    'flags': 0,
+}
+
+TOKEN_PATTERN = re.compile(r'bench-(\d+)')
+
+# discord.py only parses bodies with a content type of exactly 'application/json', without charset
+def discord_response(body, **kwargs):
+    return web.Response(body=json.dumps(body).encode(), content_type='application/json', **kwargs)
+
+class FakeDiscord:
+    """
+    Minimal Discord REST API: logs in the bot (user and application info), accepts message sends and edits,
+    and applies a fixed window rate limit per channel and method with the same
+    headers and 429 responses Discord uses.
+    """
+
+    def __init__(self, rate_limit, rate_limit_window):
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.delivered = {}
+        self.calls = Counter()
+        self.embeds = 0
+        self.buckets = {}
+        self.message_ids = itertools.count(1)
+        self.app = web.Application()
+        self.app.router.add_get('/api/v10/users/@me', self.handle_me)
+        self.app.router.add_get('/api/v10/oauth2/applications/@me', self.handle_application)
+        self.app.router.add_post('/api/v10/channels/{channel_id}/messages', self.handle_send)
+        self.app.router.add_patch('/api/v10/channels/{channel_id}/messages/{message_id}', self.handle_edit)
+
+    async def handle_me(self, request):
+        return discord_response(BOT_USER)
+
+    async def handle_application(self, request):
+        return discord_response(APPLICATION)
+
+    # Function to take a request from the bucket, returns the rate limit headers or None when the bucket is exhausted
+    def take(self, method, channel_id):
+        now = time.monotonic()
+        bucket = f'{method}-{channel_id}'
+        started, count = self.buckets.get(bucket, (now, 0))
+        if now - started >= self.rate_limit_window:
+            started, count = now, 0
+        reset_after = self.rate_limit_window - (now - started)
+        if count >= self.rate_limit:
+            self.calls['429'] += 1
+            return None, reset_after
+        self.buckets[bucket] = (started, count + 1)
+        return {
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(self.rate_limit - count - 1),
+            'X-RateLimit-Reset': str(time.time() + reset_after),
+            'X-RateLimit-Reset-After': f'{reset_after:.3f}',
+            'X-RateLimit-Bucket': bucket,
+        }, reset_after
+
+    async def deliver(self, request, method, message_id):
+        arrived = time.monotonic()
+        channel_id = request.match_info['channel_id']
+        headers, reset_after = self.take(method, channel_id) if self.rate_limit else ({}, 0)
+        if headers is None:
+            body = {'message': 'You are being rate limited.', 'retry_after': reset_after, 'global': False}
+            return discord_response(body, status=429, headers={'Via': '1.1 google', 'Retry-After': str(math.ceil(reset_after))})
+        payload = await request.json()
+        embeds = payload.get('embeds') or []
+        self.calls[method] += 1
+        self.embeds += len(embeds)
+        for token in set(TOKEN_PATTERN.findall(json.dumps(embeds))):
+            self.delivered.setdefault(int(token), arrived)
+        message = {
+            'id': str(message_id),
+            'channel_id': channel_id,
+            'type': 0,
+            'content': payload.get('content') or '',
+            'author': BOT_USER,
+            'embeds': embeds,
+            'attachments': [],
+            'mentions': [],
+            'mention_roles': [],
+            'mention_everyone': False,
+            'pinned': False,
+            'tts': False,
+            'timestamp': '2024-03-01T20:15:00+00:00',
+            'edited_timestamp': None if method == 'POST' else '2024-03-01T20:15:00+00:00',
+            'flags': 0,
+            'components': [],
+        }
+        return discord_response(message, headers=headers)
+
+    async def handle_send(self, request):
+        return await self.deliver(request, 'POST', next(self.message_ids))
+
+    async def handle_edit(self, request):
+        return await self.deliver(request, 'PATCH', request.match_info['message_id'])
+
+class StubTMDB:
+    """
+    TMDB stub answering the poster lookups of the Sonarr and Radarr embeds after a fixed latency.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+        self.app = web.Application()
+        self.app.router.add_get('/3/find/{id}', self.handle_find)
+        self.app.router.add_get('/3/{media_type}/{id}', self.handle_details)
+
+    async def respond(self, body):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response(body)
+
+    async def handle_find(self, request):
+        return await self.respond({'tv_results': [{'id': 1, 'poster_path': '/bench.jpg'}]})
+
+    async def handle_details(self, request):
+        return await self.respond({'id': 1, 'poster_path': '/bench.jpg'})
+
+# Function to start an aiohttp app on a free localhost port, returns the runner and its base url
+async def serve(app):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f'http://{host}:{port}'
+
+def load_payloads(source):
+    with open(os.path.join(PAYLOADS, f'{source}.json')) as f:
+        return json.load(f)
+
+# Function to fill in a payload template, '{token}' is replaced in every string and "{n}" becomes the number itself
+def fill(value, n):
+    if isinstance(value, dict):
+        return {key: fill(item, n) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, n) for item in value]
+    if isinstance(value, str):
+        return n if value == '{n}' else value.replace('{token}', f'bench-{n}')
+    return value
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+async def post_webhook(session, url, payload, n, source, events):
+    posted = time.monotonic()
+    event = {'n': n, 'source': source, 'posted': posted, 'status': None, 'ack': None}
+    events.append(event)
+    try:
+        async with session.post(url, json=payload) as response:
+            await response.read()
+            event['status'] = response.status
+    except Exception as e:
+        event['status'] = repr(e)
+    event['ack'] = time.monotonic() - posted
+
+# Function to post the payloads of a source at a fixed rate, the schedule doesn't wait for responses (open loop)
+async def replay(session, base_url, source, rate, duration, numbers, events):
+    templates = load_payloads(source)
+    interval = 1 / rate
+    started = time.monotonic()
+    posts = []
+    for i in itertools.count():
+        due = started + i * interval
+        if due - started >= duration:
+            break
+        await asyncio.sleep(max(0, due - time.monotonic()))
+        n = next(numbers)
+        payload = fill(copy.deepcopy(templates[i % len(templates)]), n)
+        posts.append(asyncio.create_task(post_webhook(session, f'{base_url}/{source}', payload, n, source, events)))
+    await asyncio.gather(*posts)
+
+async def sample_depths(samples, interval, started, queue_stats, lane_depths):
+    while True:
+        samples.append((time.monotonic() - started, queue_stats()['depth'], sum(lane_depths().values())))
+        await asyncio.sleep(interval)
+
+def summarize(events, delivered, sources):
+    rows = {}
+    for source in sources + ['total']:
+        selected = [event for event in events if source == 'total' or event['source'] == source]
+        accepted = [event for event in selected if event['status'] == 202]
+        latencies = [delivered[event['n']] - event['posted'] for event in accepted if event['n'] in delivered]
+        acks = [event['ack'] for event in selected if event['ack'] is not None]
+        rows[source] = {
+            'sent': len(selected),
+            'accepted': len(accepted),
+            'delivered': len(latencies),
+            'missing': len(accepted) - len(latencies),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else None,
+            'ack_p50': percentile(acks, 50),
+            'ack_p99': percentile(acks, 99),
+        }
+    return rows
+
+# Function to get the highest queue and lane depth per second of the run
+def depth_timeline(samples):
+    timeline = {}
+    for offset, queue_depth, lane_depth in samples:
+        second = int(offset)
+        previous = timeline.get(second, (0, 0))
+        timeline[second] = (max(previous[0], queue_depth), max(previous[1], lane_depth))
+    return [{'second': second, 'queue': queue, 'lanes': lanes} for second, (queue, lanes) in sorted(timeline.items())]
+
+def format_seconds(value):
+    return '-' if value is None else f'{value * 1000:.0f}ms'
+
+def print_report(report):
+    print(f"\nWebhook-to-Discord latency ({report['duration']:.0f}s replay, settings: {report['settings']})\n")
+    print(f"{'source':<12}{'sent':>7}{'accepted':>10}{'delivered':>11}{'missing':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'ack p50':>10}{'ack p99':>10}")
+    for source, row in report['latency'].items():
+        print(f"{source:<12}{row['sent']:>7}{row['accepted']:>10}{row['delivered']:>11}{row['missing']:>9}"
+              + ''.join(f'{format_seconds(row[column]):>10}' for column in ('p50', 'p95', 'p99', 'max', 'ack_p50', 'ack_p99')))
+    throughput = report['throughput']
+    print(f"\nThroughput: {throughput['offered']:.2f} webhooks/s offered, {throughput['delivered']:.2f} webhooks/s delivered")
+    print(f"Discord calls: {dict(report['discord']['calls'])}, {report['discord']['embeds']} embeds sent, TMDB requests: {report['tmdb_requests']}")
+    print("\nDepth over time (max per second)")
+    print(f"{'second':>8}{'queue':>8}{'lanes':>8}")
+    for row in report['depth']:
+        print(f"{row['second']:>8}{row['queue']:>8}{row['lanes']:>8}")
+
+async def run(args):
+    discord_api = FakeDiscord(args.rate_limit, args.rate_limit_window)
+    tmdb_stub = StubTMDB(args.tmdb_latency)
+    discord_runner, discord_url = await serve(discord_api.app)
+    tmdb_runner, tmdb_url = await serve(tmdb_stub.app)
+
+    # Logs and caches of the bot are written to a throwaway folder
+    workdir = tempfile.mkdtemp(prefix='serverbot-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.environ.update(BENCH_ENV)
+    os.environ['TMDB_API_URL'] = f'{tmdb_url}/3'
+
+    import discord
+    discord.http.Route.BASE = f'{discord_url}/api/v10'
+
+    # The state files (caches, watermarks, the Trakt history database) are opened when main is imported,
+    # data_path is pointed at the throwaway folder first so the bot starts empty and leaves src/json alone
+    from src import cache
+    cache.data_path = lambda filename: os.path.join(workdir, filename)
+
+    import main
+    from src.custom_logger import logger
+    from src import send_scheduler, sonarr_messages, webhook_queue
+    from src.http_client import close_sessions
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    if args.grab_window is not None:
+        sonarr_messages.SONARR_GRAB_WINDOW = args.grab_window
+    if args.batch_window is not None:
+        send_scheduler.EMBED_BATCH_WINDOW = args.batch_window
+    if args.no_batching:
+        send_scheduler.EMBED_BATCHING = False
+    if args.workers is not None:
+        webhook_queue.WEBHOOK_WORKERS = args.workers
+
+    await main.bot.login(main.TOKEN)
+    app_runner, app_url = await serve(main.app)
+    webhook_queue.start_workers()
+
+    events = []
+    samples = []
+    numbers = itertools.count(1)
+    started = time.monotonic()
+    sampler = asyncio.create_task(sample_depths(samples, args.sample_interval, started, webhook_queue.queue_stats, send_scheduler.lane_depths))
+    async with ClientSession() as session:
+        await asyncio.gather(*(
+            replay(session, app_url, source, rate, args.duration, numbers, events)
+            for source, rate in args.rates.items() if rate > 0
+        ))
+
+    # Wait until every accepted webhook reached Discord or the drain timeout passed
+    accepted = {event['n'] for event in events if event['status'] == 202}
+    deadline = time.monotonic() + args.drain_timeout
+    while not accepted <= discord_api.delivered.keys() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    sampler.cancel()
+
+    delivered = discord_api.delivered
+    first_post = min((event['posted'] for event in events), default=started)
+    last_delivery = max(delivered.values(), default=first_post)
+    report = {
+        'duration': args.duration,
+        'settings': {
+            'grab_window': sonarr_messages.SONARR_GRAB_WINDOW,
+            'batching': send_scheduler.EMBED_BATCHING,
+            'batch_window': send_scheduler.EMBED_BATCH_WINDOW,
+            'workers': webhook_queue.WEBHOOK_WORKERS,
+            'rates': args.rates,
+        },
+        'latency': summarize(events, delivered, [source for source, rate in args.rates.items() if rate > 0]),
+        'throughput': {
+            'offered': len(events) / args.duration,
+            'delivered': len(accepted & delivered.keys()) / max(last_delivery - first_post, 1e-9),
+        },
+        'discord': {'calls': dict(discord_api.calls), 'embeds': discord_api.embeds},
+        'tmdb_requests': tmdb_stub.requests,
+        'depth': depth_timeline(samples),
+    }
+
+    for task in webhook_queue.workers + list(send_scheduler.lane_tasks.values()):
+        task.cancel()
+    await main.bot.close()
+    await close_sessions()
+    for runner in (app_runner, discord_runner, tmdb_runner):
+        await runner.cleanup()
+    os.chdir(cwd)
+    return report
+
+def parse_rate(value):
+    source, _, rate = value.partition('=')
+    if source not in SOURCES:
+        raise argparse.ArgumentTypeError(f"unknown source '{source}', expected one of {', '.join(SOURCES)}")
+    try:
+        return source, float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rate '{rate}' for {source}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay recorded webhooks against local stand-ins of Discord and TMDB and report the latency.')
+    parser.add_argument('--rate', type=parse_rate, action='append', default=[], metavar='SOURCE=N',
+                        help=f'webhooks per second for a source, 0 disables it (defaults: {DEFAULT_RATES})')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to replay webhooks for')
+    parser.add_argument('--drain-timeout', type=float, default=60, help='seconds to wait for the last webhooks to reach Discord')
+    parser.add_argument('--tmdb-latency', type=float, default=0.05, help='seconds the TMDB stub takes to answer')
+    parser.add_argument('--rate-limit', type=int, default=5, help='messages per channel and method per window, 0 disables the rate limit')
+    parser.add_argument('--rate-limit-window', type=float, default=5, help='seconds of a rate limit window')
+    parser.add_argument('--grab-window', type=float, help='override SONARR_GRAB_WINDOW')
+    parser.add_argument('--batch-window', type=float, help='override EMBED_BATCH_WINDOW')
+    parser.add_argument('--no-batching', action='store_true', help='disable EMBED_BATCHING')
+    parser.add_argument('--workers', type=int, help='override WEBHOOK_WORKERS')
+    parser.add_argument('--sample-interval', type=float, default=0.25, help='seconds between queue depth samples')
+    parser.add_argument('--log-level', default='WARNING', help='log level of the bot during the run')
+    parser.add_argument('--json', metavar='PATH', help='also write the report as JSON')
+    parser.add_argument('--max-p95', type=float, metavar='SECONDS', help='fail when the total p95 latency is higher')
+    args = parser.parse_args()
+    args.rates = {**DEFAULT_RATES, **dict(args.rate)}
+    return args
+
+def main():
+    args = parse_args()
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    total = report['latency']['total']
+    failed = False
+    if total['missing']:
+        print(f"\nFAIL: {total['missing']} accepted webhooks never reached Discord")
+        failed = True
+    if args.max_p95 is not None and (total['p95'] is None or total['p95'] > args.max_p95):
+        print(f"\nFAIL: p95 latency {format_seconds(total['p95'])} is above {format_seconds(args.max_p95)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
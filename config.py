@@ -2,4 +2,44 @@
 Global config variables
 """
 
-LOG_LEVEL = 'INFO'  # or 'DEBUG, WARNING, ERROR, CRITICAL'
\ No newline at end of file
+LOG_LEVEL = 'INFO'  # or 'DEBUG, WARNING, ERROR, CRITICAL'
+
+# Webhook ingestion
+WEBHOOK_WORKERS = 4  # Number of workers building embeds and delivering webhooks to Discord
+WEBHOOK_QUEUE_SIZE = 1000  # Maximum number of queued webhooks, new webhooks are rejected with 503 when full
+WEBHOOK_DEDUP_WINDOW = 600  # Seconds during which a retried webhook with the same content is dropped
+WEBHOOK_DEDUP_SIZE = 5000  # Maximum number of webhook keys remembered for deduplication
+
+# Discord delivery
+EMBED_BATCHING = True  # Combine Radarr, Watchtower and Plex embeds per channel into messages of up to 10 embeds
+EMBED_BATCH_WINDOW = 2.0  # Seconds to wait for more embeds before a batch is sent
+
+# Sonarr grouped messages
+SONARR_MESSAGE_CACHE_SIZE = 200  # Number of (series, season) messages remembered for grouping grabs and deletes
+SONARR_MESSAGE_IDLE_TIMEOUT = 86400  # Seconds without new events before a series/season starts a new message
+SONARR_GRAB_WINDOW = 10  # Seconds to collect grabs of the same series and season into one consolidated embed
+
+# TMDB metadata
+TMDB_CACHE_SIZE = 5000  # Number of TMDB lookups (posters, details) remembered across restarts
+TMDB_CACHE_TTL = 604800  # Seconds before a cached TMDB lookup is fetched again
+
+# Sonarr series index
+SERIES_INDEX_SIZE = 10000  # Number of series (TVDB id -> TMDB id and poster) remembered across restarts
+SERIES_POSTER_TTL = 604800  # Seconds before the poster of an indexed series is looked up again, the TMDB id is kept
+SONARR_SERIES_EXPORT = None  # Optional path to a Sonarr series export (JSON of /api/v3/series) to seed the series index at startup
+
+# Trakt history
+TRAKT_HISTORY_BACKFILL_DAYS = 365  # Days of Trakt history downloaded into the local store on the first sync
+
+# Trakt polling
+TRAKT_RATINGS_INTERVAL = 5  # Minutes between checks for new ratings, unchanged ratings cost one small request
+TRAKT_FAVORITES_INTERVAL = 60  # Minutes between checks for new favorites
+TRAKT_PREFETCH_PAGES = 4  # Pages of a long Trakt list requested ahead while the current page is handled
+
+# RetroAchievements
+RETRO_POLL_MIN_INTERVAL = 2  # Minutes between checks for new achievements of a user that just unlocked something
+RETRO_POLL_MAX_INTERVAL = 60  # Upper bound of the interval, which doubles with every check that finds nothing
+RETRO_REQUESTS_PER_SECOND = 2  # Budget for all RetroAchievements API calls together, users are polled concurrently within it
+RETRO_GAME_CACHE_SIZE = 2000  # Number of games (metadata of API_GetGameExtended) remembered across restarts
+RETRO_GAME_CACHE_TTL = 2592000  # Seconds before the metadata of a game is fetched again
+RETRO_MASTERY_RECONCILE = 604800  # Seconds after which the mastery count of a user is recounted instead of incremented
@@ -1,6 +1,7 @@
 import discord
 from discord.ext import tasks, commands
 from aiohttp import web
+import msgspec
 from datetime import datetime, timedelta, time   
 import asyncio
 
@@ -25,16 +26,12 @@ from src.globals import (
     RETRO_TARGET_USERNAMES
 )
 
-from src.plex import (
-    plex_play, 
-    plex_resume, 
-    plex_episode_content, 
-    plex_season_content, 
-    plex_movie_content
-)
+from config import TRAKT_RATINGS_INTERVAL, TRAKT_FAVORITES_INTERVAL
+
+from src.plex import plex_embed
 
-from src.trakt_favorites import trakt_favorites
-from src.trakt_ratings import trakt_ratings
+from src.trakt_favorites import trakt_favorites, mark_favorites_sent
+from src.trakt_ratings import trakt_ratings, mark_ratings_sent
 from src.trakt_user_weekly import create_weekly_user_embed
 from src.trakt_global_weekly import create_weekly_global_embed
 from src.tautulli_presence import tautulli_discord_presence
@@ -43,7 +40,16 @@ from src.sonarr import create_sonarr_embed
 from src.radarr import create_radarr_embed
 from src.system import system_info
 from src.plextraktsync import plextraktsync
-from src.retroachievements import fetch_completion, fetch_recent_achievements, create_daily_overview
+from src.retroachievements import fetch_recent_achievements, create_daily_overview, set_watermark
+from src.retro_scheduler import start_scheduler as start_retro_scheduler
+from src.http_client import close_sessions
+from src.cache import flush_caches
+from src.utils import split_embeds
+from src.webhook_queue import enqueue, queue_stats, register_processor, start_workers
+from src.send_scheduler import send as send_message, send_embed, lane_depths
+from src.sonarr_messages import deliver_grouped_embed, queue_grab
+from src.dedup import webhook_key, is_duplicate, remember
+from src.schemas import sonarr_decoder, radarr_decoder, plex_decoder, watchtower_decoder
 
 import asyncio
 from datetime import datetime, timedelta
@@ -65,8 +71,7 @@ async def on_ready():
     logger.info("Trakt Favorites Task started")
     tautulli_discord_activity.start()
     logger.info("Tautulli Discord Activity Task started")
-    fetch_retroachievements.start()
-    logger.info("RetroAchievements Achievement Fetch Task started")
+    start_retro_scheduler(post_recent_achievements, RETRO_TARGET_USERNAMES)
 
     # Calculate the time until the next midnight
     now = datetime.now()
@@ -99,45 +104,51 @@ async def send(ctx, channel_id: int, *, message: str):
 async def clear(ctx):
     await ctx.channel.purge()
 
-@tasks.loop(minutes=30)
-async def fetch_retroachievements():
-    try:
-        for username in RETRO_TARGET_USERNAMES:
-            # Fetch the completion progress for all games
-            completion_cache = fetch_completion(username)
-            # Fetch the recent achievements
-            achievements = fetch_recent_achievements(completion_cache, username)
-            # Convert the achievements to Discord embeds
-            embeds = [discord.Embed.from_dict(achievement) for achievement in achievements]
-            for embed in embeds:
-                # Get the channel where you want to send the message
-                if 'Mastered' in embed.author.name:
-                    channel = bot.get_channel(CHANNEL_MASTERED)  # Replace with your channel ID for Mastered
-                elif 'Achievement Unlocked' in embed.author.name:
-                    channel = bot.get_channel(CHANNEL_ACHIEVEMENTS)  # Replace with your channel ID for Unlocks
-                else:
-                    channel = bot.get_channel(CHANNEL_ACHIEVEMENTS)  # Replace with your default channel ID
-                # Send a new message
-                await channel.send(embed=embed)
-            if len(achievements) > 0:
-                logger.info(f'Fetched {len(achievements)} recent achievements for {username}')
-                logger.debug(f'Fetched achievements: {achievements}')
-    except Exception as e:
-        logger.error(f'An error occurred while fetching retroachievements: {e}')
+# Function to fetch and post the recent achievements of one user, returns the number of posted messages
+async def post_recent_achievements(username):
+    # Fetch the recent achievements, the completion progress is fetched along when needed
+    achievements = await fetch_recent_achievements(username)
+    if not achievements:
+        return 0
+    for index, (achievement, watermark) in enumerate(achievements):
+        # Convert the achievement to a Discord embed
+        embed = discord.Embed.from_dict(achievement)
+        # Get the channel where you want to send the message
+        if 'Mastered' in embed.author.name:
+            channel = bot.get_channel(CHANNEL_MASTERED)  # Replace with your channel ID for Mastered
+        elif 'Achievement Unlocked' in embed.author.name:
+            channel = bot.get_channel(CHANNEL_ACHIEVEMENTS)  # Replace with your channel ID for Unlocks
+        else:
+            channel = bot.get_channel(CHANNEL_ACHIEVEMENTS)  # Replace with your default channel ID
+        # Send a new message
+        await channel.send(embed=embed)
+        # A mastery shares the watermark of the achievement that completed the game, the watermark only moves
+        # once every message of it was sent. A failed send repeats just those messages in the next poll,
+        # everything before it is never posted again, also across restarts.
+        if index + 1 == len(achievements) or achievements[index + 1][1] != watermark:
+            set_watermark(username, watermark)
+    logger.info(f'Fetched {len(achievements)} recent achievements for {username}')
+    logger.debug(f'Fetched achievements: {achievements}')
+    return len(achievements)
+
+# Function to send the RetroAchievements daily overview of every user, the overviews are created concurrently
+async def send_retro_overviews():
+    logger.info(f"Fetching Retro Daily Overview for {', '.join(RETRO_TARGET_USERNAMES)}")
+    embeds = await asyncio.gather(*(create_daily_overview(username) for username in RETRO_TARGET_USERNAMES))
+    # Sent in the order of RETRO_TARGET_USERNAMES, whichever overview was ready first
+    for username, embed in zip(RETRO_TARGET_USERNAMES, embeds):
+        if embed is not None:
+            channel = bot.get_channel(CHANNEL_RETRO_OVERVIEW)
+            logger.info(f"Sending Retro Daily Overview for {username}. Checking again in 24 hours.")
+            await channel.send(embed=embed)
+        else:
+            logger.debug(f"No embed to send for {username}")
 
 # Task to fetch the RetroAchievements daily overview
 @tasks.loop(hours=24)
 async def fetch_retro_overview():
     try:
-        for username in RETRO_TARGET_USERNAMES:
-            logger.info(f"Fetching Retro Daily Overview for {username}")
-            embed = create_daily_overview(username)
-            if embed is not None:
-                channel = bot.get_channel(CHANNEL_RETRO_OVERVIEW)
-                logger.info(f"Sending Retro Daily Overview for {username}. Checking again in 24 hours.")
-                await channel.send(embed=embed)
-            else:
-                logger.debug(f"No embed to send for {username}")
+        await send_retro_overviews()
     except Exception as e:
         logger.error(f"An error occurred: {e}")
 
@@ -145,15 +156,7 @@ async def fetch_retro_overview():
 @bot.command()
 async def retrooverview(ctx):
     try:
-        for username in RETRO_TARGET_USERNAMES:
-            logger.info(f"Fetching Retro Daily Overview for {username}")
-            embed = create_daily_overview(username)
-            if embed is not None:
-                channel = bot.get_channel(CHANNEL_RETRO_OVERVIEW)
-                logger.info(f"Sending Retro Daily Overview for {username}. Checking again in 24 hours.")
-                await channel.send(embed=embed)
-            else:
-                logger.debug(f"No embed to send for {username}")
+        await send_retro_overviews()
         await ctx.send("Retro Daily Manual Overview sent successfully.")
     except Exception as e:
         logger.error(f"An error occurred: {e}")
@@ -164,13 +167,13 @@ async def retrooverview(ctx):
 async def send_weekly_embeds(ctx):
     try:
         # Weekly Trakt User Plays
-        data_user = create_weekly_user_embed()
+        data_user = await create_weekly_user_embed()
         channel_user = bot.get_channel(CHANNEL_TRAKT_USER)
         for embed in data_user['embeds']:
             await channel_user.send(embed=discord.Embed.from_dict(embed))
         await ctx.send("Weekly Trakt User Plays sent successfully.")
         # Weekly Trakt Global Plays
-        data_global = create_weekly_global_embed()
+        data_global = await create_weekly_global_embed()
         channel_global = bot.get_channel(CHANNEL_TRAKT_GLOBAL)
         for embed in data_global['embeds']:
             await channel_global.send(embed=discord.Embed.from_dict(embed))
@@ -230,178 +233,196 @@ async def tautulli_discord_activity():
     except Exception as e:
         logger.error(f'An error occurred while calling Tautulli Discord Activity {e}')
         
+# Function to send the embeds of new Trakt items, mark_sent(ids, newest) remembers them message by message
+async def send_trakt_embeds(channel, data, mark_sent):
+    sent = 0
+    for embeds in split_embeds(data['embeds']):
+        ids = data['ids'][sent:sent + len(embeds)]
+        sent += len(embeds)
+        try:
+            await channel.send(embeds=[discord.Embed.from_dict(embed) for embed in embeds])
+        except discord.HTTPException as e:
+            if e.status != 400:
+                raise
+            # Discord rejected the message, the embeds are sent one by one so only an invalid one is lost
+            for item_id, embed in zip(ids, embeds):
+                try:
+                    await channel.send(embed=discord.Embed.from_dict(embed))
+                except discord.HTTPException as e:
+                    if e.status != 400:
+                        raise
+                    logger.error(f"Discord rejected the Trakt embed {embed.get('title')}: {e}")
+                mark_sent([item_id])
+            continue
+        mark_sent(ids)
+    # The watermark only moves once every message was sent, a failed send is retried at the next poll
+    mark_sent([], data['newest'])
+
 # Trakt Ratings Task Loop
-@tasks.loop(minutes=60)
+@tasks.loop(minutes=TRAKT_RATINGS_INTERVAL)
 async def trakt_ratings_task():
     logger.info("Starting Trakt Ratings Task.")
     try:
-        data = trakt_ratings()
+        data = await trakt_ratings()
         if data is not None:
             channel = bot.get_channel(CHANNEL_TRAKT_RATINGS)
-            for embed in data['embeds']:
-                await channel.send(embed=discord.Embed.from_dict(embed))
+            await send_trakt_embeds(channel, data, mark_ratings_sent)
         else:
-            logger.info("No rating data to send. Trying again in 1 hour.")
+            logger.info(f"No rating data to send. Trying again in {TRAKT_RATINGS_INTERVAL} minutes.")
     except Exception as e:
         logger.error(f'Error occurred: {str(e)}')
 
 # Trakt Favorites Task Loop        
-@tasks.loop(hours=24)
+@tasks.loop(minutes=TRAKT_FAVORITES_INTERVAL)
 async def trakt_favorites_task():
     logger.info("Starting Trakt Favorites Task")
     try:
-        data = trakt_favorites()
+        data = await trakt_favorites()
         channel = bot.get_channel(CHANNEL_TRAKT_RATINGS)
         if data is not None:
-            for embed in data['embeds']:
-                await channel.send(embed=discord.Embed.from_dict(embed))
+            await send_trakt_embeds(channel, data, mark_favorites_sent)
         else:
-            logger.info("No favorite data to send. Trying again in 24 hours.")
+            logger.info(f"No favorite data to send. Trying again in {TRAKT_FAVORITES_INTERVAL} minutes.")
     except Exception as e:
         logger.error(f'Error occurred: {str(e)}')
 
-# Create a queue for the messages
-message_queue = asyncio.Queue()
+# Function to get the channel a webhook is delivered to, a partial channel is used until the channel cache is ready
+def get_webhook_channel(channel_id):
+    return bot.get_channel(channel_id) or bot.get_partial_messageable(channel_id)
 
-# This dictionary will store the last message ID for each series and season
-last_messages = {}
+# Function to decode the raw body of a webhook into its schema, returns a 400 response if it doesn't match
+async def read_payload(request, source, decoder):
+    body = await request.read()
+    try:
+        return decoder.decode(body), None
+    except msgspec.DecodeError as e:
+        logger.warning(f"Invalid {source} webhook received: {e}")
+        return None, web.Response(status=400, text=str(e))
+
+# Function to queue a validated payload and acknowledge the webhook
+def accept_webhook(source, data):
+    key = webhook_key(source, data)
+    if is_duplicate(key):
+        # Acknowledge retries so the sender stops, but don't process them again
+        logger.info(f"Duplicate {source} webhook received, skipping.")
+        return web.Response()
+    if not enqueue(source, data):
+        return web.Response(status=503)
+    remember(key)
+    logger.debug(f"{source.capitalize()} webhook queued.")
+    return web.Response(status=202)
 
 # Webhook setup for Sonarr
 async def handle_sonarr(request):
-    try:
-        data = await request.json()
-        logger.debug(f"Sonarr webhook data: {data}")
-        event_type = data.get('eventType', 'N/A')
-        embed_data = create_sonarr_embed(data)
-        channel_id = CHANNEL_SONARR_GRABS
-        channel = bot.get_channel(channel_id)
-        embed = discord.Embed.from_dict(embed_data)
-
-        if event_type in ['Grab', 'EpisodeFileDelete']:
-            # Create a key for the series and season
-            series_title = data['series'].get('title',)
-            season_number = data['episodes'][0].get('seasonNumber')
-            key = (series_title, season_number)
-
-            # Check if there's an existing message for this series and season
-            if key in last_messages:
-                # If there is, edit the message
-                message_id = last_messages[key]
-                message = await channel.fetch_message(message_id)
-                # Get the existing embeds
-                embeds = message.embeds
-                # Check if the message already has 10 embeds
-                if len(embeds) < 10:
-                    # If not, add the new embed
-                    embeds.append(embed)
-                    # Update the message with the new list of embeds
-                    await message.edit(embeds=embeds)
-                else:
-                    # If it does, send a new message and store its ID
-                    message = await channel.send(embed=embed)
-                    last_messages[key] = message.id
-            else:
-                # If there isn't, send a new message and store its ID
-                message = await channel.send(embed=embed)
-                last_messages[key] = message.id
-        else:
-            # If the event type is not Grab or EpisodeFileDelete, send a new message without storing its ID
-            await channel.send(embed=embed)
-
-        logger.info("Sonarr webhook received and processed successfully.")
-        logger.debug(f"Sonarr embed data: {embed_data}")
-        return web.Response()
-    except Exception as e:
-        logger.error(f"Error processing Sonarr webhook: {e}")
-        return web.Response(status=500)
+    data, error = await read_payload(request, 'sonarr', sonarr_decoder)
+    if error is not None:
+        return error
+    return accept_webhook('sonarr', data)
+
+async def process_sonarr(data):
+    logger.debug(f"Sonarr webhook data: {data}")
+    event_type = data.event_type
+    channel_id = CHANNEL_SONARR_GRABS
+    channel = get_webhook_channel(channel_id)
+
+    if event_type in ['Grab', 'EpisodeFileDelete']:
+        # Create a key for the series and season
+        key = (data.series.title, data.episodes[0].season_number)
+
+    if event_type == 'Grab':
+        # Grabs are collected per series and season and sent as one embed
+        queue_grab(channel, key, data)
+        logger.info("Sonarr webhook received and queued for grouping.")
+        return
+
+    embed_data = await create_sonarr_embed(data)
+    if event_type == 'EpisodeFileDelete':
+        # Group the embed with the other events of the same series and season
+        await deliver_grouped_embed(channel, key, embed_data)
+    else:
+        # If the event type is not Grab or EpisodeFileDelete, send a new message without grouping it
+        send_message(channel, embed=discord.Embed.from_dict(embed_data))
+
+    logger.info("Sonarr webhook received and processed successfully.")
+    logger.debug(f"Sonarr embed data: {embed_data}")
 
 # Webhook setup for Radarr
 async def handle_radarr(request):
-    try:
-        data = await request.json()
-        logger.debug(f"Radarr webhook data: {data}")
-        embed_data = create_radarr_embed(data)
-        channel_id = CHANNEL_RADARR_GRABS
-        channel = bot.get_channel(channel_id)
-        embed = discord.Embed.from_dict(embed_data)
-        await message_queue.put((channel, embed))
-        logger.info("Radarr webhook received and processed successfully.")
-        logger.debug(f"Radarr embed data: {embed_data}")
-        return web.Response()
-    except Exception as e:
-        logger.error(f"Error processing Radarr webhook: {e}")
-        return web.Response(status=500)
+    data, error = await read_payload(request, 'radarr', radarr_decoder)
+    if error is not None:
+        return error
+    return accept_webhook('radarr', data)
+
+async def process_radarr(data):
+    logger.debug(f"Radarr webhook data: {data}")
+    embed_data = await create_radarr_embed(data)
+    channel_id = CHANNEL_RADARR_GRABS
+    channel = get_webhook_channel(channel_id)
+    embed = discord.Embed.from_dict(embed_data)
+    send_embed(channel, embed)
+    logger.info("Radarr webhook received and processed successfully.")
+    logger.debug(f"Radarr embed data: {embed_data}")
     
 # Webhook setup for Watchtower
 async def handle_watchtower(request):
-    try:
-        data = await request.json()
-        embed_data = create_watchtower_embed(data)
-        channel_id = CHANNEL_WATCHTOWER
-        channel = bot.get_channel(channel_id)
-        embed = discord.Embed.from_dict(embed_data)
-        await message_queue.put((channel, embed))
-        logger.info("Watchtower webhook received and processed successfully.")
-        return web.Response()
-    except Exception as e:
-        logger.error(f"Error processing Watchtower webhook: {e}")
-        return web.Response(status=500)
+    data, error = await read_payload(request, 'watchtower', watchtower_decoder)
+    if error is not None:
+        return error
+    return accept_webhook('watchtower', data)
+
+async def process_watchtower(data):
+    embed_data = create_watchtower_embed(data)
+    channel_id = CHANNEL_WATCHTOWER
+    channel = get_webhook_channel(channel_id)
+    embed = discord.Embed.from_dict(embed_data)
+    send_embed(channel, embed)
+    logger.info("Watchtower webhook received and processed successfully.")
+
+# Webhook types from Tautulli and the channel they are sent to
+PLEX_WEBHOOK_CHANNELS = {
+    'nowplaying': CHANNEL_PLEX_PLAYING,
+    'nowresuming': CHANNEL_PLEX_PLAYING,
+    'newcontent_episode': CHANNEL_PLEX_CONTENT,
+    'newcontent_season': CHANNEL_PLEX_CONTENT,
+    'newcontent_movie': CHANNEL_PLEX_CONTENT,
+}
 
 # Webhook setup for Plex/Tautulli
 async def handle_plex(request):
-    try:
-        data = await request.json()
-        playing_channel_id = CHANNEL_PLEX_PLAYING
-        content_channel_id = CHANNEL_PLEX_CONTENT
-
-        webhook_type = data.get('server_info', {}).get('webhook_type', '')
-
-        if webhook_type == 'nowplaying':
-            embed_data, status_code = plex_play(data)
-            channel_id = playing_channel_id
-        elif webhook_type == 'nowresuming':
-            embed_data, status_code = plex_resume(data)
-            channel_id = playing_channel_id
-        elif webhook_type == 'newcontent_episode':
-            embed_data, status_code = plex_episode_content(data)
-            channel_id = content_channel_id
-        elif webhook_type == 'newcontent_season':
-            embed_data, status_code = plex_season_content(data)
-            channel_id = content_channel_id
-        elif webhook_type == 'newcontent_movie':
-            embed_data, status_code = plex_movie_content(data)
-            channel_id = content_channel_id    
-        else:
-            logger.info("Webhook received, but no relevant data found. Data not saved.")
-            return {'message': "Webhook received, but no relevant data found. Data not saved."}, 200
-
-        if 'embeds' in embed_data and isinstance(embed_data['embeds'], list):
-            for embed_dict in embed_data['embeds']:
-                channel = bot.get_channel(channel_id)
-                embed = discord.Embed.from_dict(embed_dict)
-                await channel.send(embed=embed)
-            logger.info("Plex webhook received and processed successfully.")
-        else:
-            logger.warning("No valid 'embeds' data found.")
-        
-        return web.Response(status=status_code)
-    
-    except Exception as e:
-        logger.error(f"Error processing Plex webhook: {e}")
-        return web.Response(status=500)
+    data, error = await read_payload(request, 'plex', plex_decoder)
+    if error is not None:
+        return error
+    webhook_type = data.server_info.webhook_type
+    if webhook_type not in PLEX_WEBHOOK_CHANNELS:
+        logger.info("Webhook received, but no relevant data found. Data not saved.")
+        return web.Response()
+    return accept_webhook('plex', data)
+
+async def process_plex(data):
+    embed_data = plex_embed(data)
+    if embed_data is None:
+        return
+    channel = get_webhook_channel(PLEX_WEBHOOK_CHANNELS[data.server_info.webhook_type])
+    send_embed(channel, discord.Embed.from_dict(embed_data))
+    logger.info("Plex webhook received and processed successfully.")
+
+# Endpoint to expose the webhook queue depth, useful for sizing the worker pool
+async def handle_queue_stats(request):
+    stats = queue_stats()
+    stats['channels'] = {str(channel_id): depth for channel_id, depth in lane_depths().items()}
+    return web.json_response(stats)
     
-# Task for sending the messages
-async def send_messages():
-    while True:
-        channel, embed = await message_queue.get()
-        await channel.send(embed=embed)
-        await asyncio.sleep(1)
+register_processor('sonarr', process_sonarr)
+register_processor('radarr', process_radarr)
+register_processor('watchtower', process_watchtower)
+register_processor('plex', process_plex)
 
 app = web.Application()
 app.router.add_post('/sonarr', handle_sonarr)
 app.router.add_post('/radarr', handle_radarr)
 app.router.add_post('/plex', handle_plex)
 app.router.add_post('/watchtower', handle_watchtower)
+app.router.add_get('/queue', handle_queue_stats)
 
 # Start the web server for the webhook
 uvicorn_params = {
@@ -415,15 +436,18 @@ uvicorn_app.router.add_post("/sonarr", handle_sonarr)
 uvicorn_app.router.add_post("/radarr", handle_radarr)
 uvicorn_app.router.add_post("/plex", handle_plex)
 uvicorn_app.router.add_post("/watchtower", handle_watchtower)
+uvicorn_app.router.add_get("/queue", handle_queue_stats)
 uvicorn_server = web.AppRunner(uvicorn_app)
 
 async def start():
     await uvicorn_server.setup()
-    asyncio.create_task(send_messages())
+    start_workers()
     await web._run_app(uvicorn_app, **uvicorn_params)
 
 async def cleanup():
     await uvicorn_server.cleanup()
+    await close_sessions()
+    flush_caches()
 
 async def run_bot():
     await bot.start(TOKEN)
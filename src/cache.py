@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+from .custom_logger import logger
+
+"""
+Bounded LRU cache with optional expiry and persistence to the src/json folder.
+"""
+
+SAVE_DELAY = 30  # Seconds a changed cache waits before it is written, changes in between share the write
+
+# Caches with a file, flushed on shutdown
+persistent_caches = []
+
+# Sentinel to tell a missing entry apart from a cached None
+MISSING = object()
+
+# Function to get the path of a file in the src/json folder, creating the folder if needed
+def data_path(filename):
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'json')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, filename)
+
+class TTLCache:
+    """
+    LRU cache holding at most `maxsize` entries. Entries expire `ttl` seconds after
+    they were last set (never if `ttl` is None). When `filename` is given, the cache
+    can be loaded from and saved to a JSON file, so keys and values must be JSON
+    serializable (tuple keys are restored as tuples).
+    """
+
+    def __init__(self, maxsize, ttl=None, filename=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = data_path(filename) if filename else None
+        self.entries = OrderedDict()
+        self.dirty = False
+        self.save_timer = None
+        if self.path:
+            persistent_caches.append(self)
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __len__(self):
+        return len(self.entries)
+
+    def expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        value, stored_at = entry
+        if self.expired(stored_at):
+            del self.entries[key]
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (value, time.time())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def items(self):
+        return [(key, value) for key, (value, stored_at) in self.entries.items() if not self.expired(stored_at)]
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            logger.info(f"File {self.path} not found. Skipping loading.")
+            return
+        except ValueError as e:
+            logger.error(f"Could not parse {self.path}: {e}")
+            return
+        for key, value, stored_at in stored:
+            key = tuple(key) if isinstance(key, list) else key
+            if not self.expired(stored_at):
+                self.entries[key] = (value, stored_at)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        logger.info(f"Successfully loaded {len(self.entries)} entries from {self.path}")
+
+    def save_later(self):
+        """
+        Marks the cache as changed and saves it SAVE_DELAY seconds later, so a
+        burst of changes costs a single write. Must be called from the event loop.
+        """
+        self.dirty = True
+        if self.save_timer is None:
+            self.save_timer = asyncio.get_running_loop().call_later(SAVE_DELAY, self.flush)
+
+    # Function to save the cache now if it has unsaved changes
+    def flush(self):
+        if self.save_timer is not None:
+            self.save_timer.cancel()
+            self.save_timer = None
+        if self.dirty:
+            self.save()
+
+    def save(self):
+        self.dirty = False
+        stored = [[key, value, stored_at] for key, (value, stored_at) in self.entries.items() if not self.expired(stored_at)]
+        # Write to a temporary file first so a crash never leaves a truncated cache behind
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(stored, f)
+        os.replace(temp_path, self.path)
+        logger.debug(f"Successfully saved {len(stored)} entries to {self.path}")
+
+# Function to save every cache with unsaved changes, called on shutdown
+def flush_caches():
+    for cache in persistent_caches:
+        cache.flush()
@@ -0,0 +1,74 @@
+import hashlib
+import msgspec
+
+from config import WEBHOOK_DEDUP_WINDOW, WEBHOOK_DEDUP_SIZE
+
+from .cache import TTLCache
+
+"""
+Idempotency for incoming webhooks.
+
+Tautulli and the *arr apps retry a webhook when it times out or fails, every
+payload therefore gets a content key that is remembered for WEBHOOK_DEDUP_WINDOW
+seconds and retries with the same key are dropped before any work is done.
+"""
+
+seen_webhooks = TTLCache(WEBHOOK_DEDUP_SIZE, ttl=WEBHOOK_DEDUP_WINDOW)
+
+# Function to hash a value that has no natural id
+def content_hash(value):
+    return hashlib.sha1(msgspec.json.encode(value)).hexdigest()
+
+def sonarr_key(payload):
+    event_type = payload.event_type
+    episode_ids = tuple(sorted(episode.id for episode in payload.episodes))
+    if event_type == 'Grab':
+        return (event_type, payload.download_id or content_hash(payload.release), episode_ids)
+    if event_type == 'EpisodeFileDelete':
+        return (event_type, payload.episode_file.id, episode_ids)
+    if event_type == 'ApplicationUpdate':
+        return (event_type, payload.previous_version, payload.new_version)
+    return None
+
+def radarr_key(payload):
+    event_type = payload.event_type
+    movie_id = payload.movie.id if payload.movie else None
+    if event_type == 'Grab':
+        return (event_type, payload.download_id or content_hash(payload.release), movie_id)
+    if event_type == 'MovieDelete':
+        return (event_type, movie_id)
+    if event_type == 'ApplicationUpdate':
+        return (event_type, payload.previous_version, payload.new_version)
+    return None
+
+def plex_key(payload):
+    stream_details = payload.stream_details
+    session_key = stream_details.session_key if stream_details else ''
+    remaining_time = stream_details.remaining_time if stream_details else ''
+    rating_key = payload.source_metadata_details.rating_key if payload.source_metadata_details else ''
+    # A retry repeats the time the event fired, pausing or resuming the same item again later in the session doesn't
+    return (payload.server_info.webhook_type, session_key, rating_key, payload.server_info.utctime, remaining_time)
+
+def watchtower_key(payload):
+    return (content_hash(payload.message),)
+
+KEY_FUNCTIONS = {
+    'sonarr': sonarr_key,
+    'radarr': radarr_key,
+    'plex': plex_key,
+    'watchtower': watchtower_key,
+}
+
+# Function to get the content key of a webhook, events without a key (e.g. Test events) are never deduplicated
+def webhook_key(source, data):
+    key = KEY_FUNCTIONS[source](data)
+    return None if key is None else (source,) + key
+
+# Function to check if a webhook with this key was already accepted within the window
+def is_duplicate(key):
+    return key is not None and key in seen_webhooks
+
+# Function to remember the key of an accepted webhook
+def remember(key):
+    if key is not None:
+        seen_webhooks.set(key, True)
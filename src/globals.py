@@ -41,6 +41,7 @@ TRAKT_URL_FAVORITES = f'https://api.trakt.tv/users/{TRAKT_USERNAME}/favorites'
 TRAKT_URL_RATINGS = f'https://api.trakt.tv/users/{TRAKT_USERNAME}/ratings'
 TRAKT_URL_USER = f'[{TRAKT_USERNAME}](https://trakt.tv/users/{TRAKT_USERNAME})'
 TRAKT_CLIENT_ID = os.getenv("TRAKT_CLIENT_ID")
+TRAKT_ACCESS_TOKEN = os.getenv("TRAKT_ACCESS_TOKEN")  # Optional OAuth token, needed for /sync/last_activities
 
 # Tautulli Globals
 TAUTULLI_API_URL = os.getenv("TAUTULLI_API_URL")
@@ -60,8 +61,7 @@ DISCORD_THUMBNAIL = "https://i.postimg.cc/KvSTwcQ0/undefined-Imgur.png"
 
 # TMDB Globals
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-TMDB_MOVIE_URL = 'https://api.themoviedb.org/3/movie/'
-TMDB_SHOW_URL = 'https://api.themoviedb.org/3/tv/'
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3")  # Overridden by the benchmarks to use a local stub
 TMDB_IMAGE_URL = 'https://image.tmdb.org/t/p/w500/'
 
 # RetroAchievements Globals
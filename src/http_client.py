@@ -0,0 +1,89 @@
+import asyncio
+import aiohttp
+
+from .custom_logger import logger
+from .singleflight import SingleFlight
+
+"""
+Shared async HTTP client for all integrations.
+
+Every upstream gets its own aiohttp session, so keep-alive connections are
+pooled per host and DNS lookups are cached instead of being resolved again
+for every request. Identical requests that run concurrently, e.g. the poster of
+a series during a burst of Sonarr grabs, are coalesced into a single request.
+"""
+
+# Connection pool and timeout settings per upstream (timeouts in seconds)
+UPSTREAMS = {
+    'tmdb': {'limit': 10, 'timeout': 10},
+    'trakt': {'limit': 10, 'timeout': 15},
+    'retroachievements': {'limit': 5, 'timeout': 20},
+    'tautulli': {'limit': 2, 'timeout': 5},
+}
+
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+
+# Errors raised by the client, the aiohttp counterpart of requests.exceptions.RequestException.
+# ValueError covers bodies that aren't JSON, e.g. an HTML error page, which requests raised as a RequestException too
+RequestError = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+sessions = {}
+
+# Requests that are in flight, keyed by upstream, url, params and headers
+inflight = SingleFlight()
+
+# Function to get (or lazily create) the pooled session for an upstream
+def get_session(upstream):
+    session = sessions.get(upstream)
+    if session is None or session.closed:
+        settings = UPSTREAMS[upstream]
+        connector = aiohttp.TCPConnector(
+            limit=settings['limit'],
+            ttl_dns_cache=DNS_CACHE_TTL,
+            use_dns_cache=True,
+            keepalive_timeout=KEEPALIVE_TIMEOUT
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings['timeout'])
+        )
+        sessions[upstream] = session
+        logger.debug(f"Created HTTP session for {upstream}")
+    return session
+
+async def fetch_json(upstream, url, params, headers):
+    session = get_session(upstream)
+    async with session.get(url, params=params, headers=headers) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+async def fetch_response(upstream, url, params, headers):
+    session = get_session(upstream)
+    async with session.get(url, params=params, headers=headers) as response:
+        response.raise_for_status()
+        # 304 Not Modified has no body, the caller still has the previous one
+        data = None if response.status == 304 else await response.json(content_type=None)
+        return response.status, response.headers.copy(), data
+
+def freeze(mapping):
+    return tuple(sorted(mapping.items())) if mapping else ()
+
+# Function to GET a url and decode the JSON body, raises RequestError on failure
+async def get_json(upstream, url, params=None, headers=None):
+    # Identical requests that are already in flight share the response instead of being sent again
+    key = (upstream, url, freeze(params), freeze(headers))
+    return await inflight.do(key, lambda: fetch_json(upstream, url, params, headers))
+
+# Function to GET a url and return the status, headers and decoded JSON body (None for 304), raises RequestError on failure
+async def get_response(upstream, url, params=None, headers=None):
+    key = ('response', upstream, url, freeze(params), freeze(headers))
+    return await inflight.do(key, lambda: fetch_response(upstream, url, params, headers))
+
+# Function to close all sessions on shutdown
+async def close_sessions():
+    for upstream, session in list(sessions.items()):
+        if not session.closed:
+            await session.close()
+        logger.debug(f"Closed HTTP session for {upstream}")
+    sessions.clear()
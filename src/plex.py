@@ -1,213 +1,176 @@
+import msgspec
+
 from src.globals import (
-    DISCORD_THUMBNAIL, 
+    DISCORD_THUMBNAIL,
     PLEX_ICON_URL
 )
 
 from .custom_logger import logger
 
-def plex_play(data):
-    try:
-        if data and 'source_metadata_details' in data and 'stream_details' in data and 'server_info' in data:
-            source_metadata = data['source_metadata_details']
-            stream_details = data['stream_details']
-            server_info = data['server_info']
-            
-            media_type = source_metadata.get('media_type', '').capitalize()
-            title = source_metadata.get('title', '')
-            
-            if media_type == 'Movie':
-                title = f"{title} ({source_metadata.get('year')})"
-                color = 16753920
-                logger.info(f"Created Movie Play embed for {source_metadata.get('title')} ({source_metadata.get('year')})")
-            elif media_type == 'Episode':
-                title = f"{title} (S{source_metadata.get('season_num00')}E{source_metadata.get('episode_num00')})"
-                color = 6719185
-                logger.info(f"Created Episode Play embed for {source_metadata.get('show_title')} (S{source_metadata.get('season_num00')}E{source_metadata.get('episode_num00')})")
-            
-            embed = {
-                'color': color,
-                'author': {'name': f"Plex - Streaming {media_type}", 'icon_url': PLEX_ICON_URL},
-                'thumbnail': {'url': source_metadata.get('poster_url', '')},
-                'title': title,
-                'timestamp': server_info.get('utctime'),
-                'url': source_metadata.get('imdb_url', ''),
-                'footer': {
-                    'text': f"{server_info.get('server_name')} | {stream_details.get('username')} | {stream_details.get('product')} | {stream_details.get('video_decision', '').title()}"
-                },
-                'image': {'url': DISCORD_THUMBNAIL},
-                'fields': [
-                    {
-                        'name': ':arrow_forward: Now Streaming',
-                        'value': f"{stream_details.get('remaining_time', '')[3:]} remaining" if stream_details.get('remaining_time', '').startswith("00:") else f"{stream_details.get('remaining_time', '')} remaining",
-                        'inline': True
-                    }
-                ]
-            }
-            logger.debug(f"Play Start embed: {embed}")
-            return {'embeds': [embed]}, 200
-        else:
-            logger.info("Webhook received, but no Source Metadata Details or Stream Details found. Data not saved.")
-            return {'message': "Webhook received, but no Source Metadata Details or Stream Details found. Data not saved."}, 200
-    except Exception as e:
-        logger.error(f"Error while processing JSON payload: {str(e)}")
-        return {'error': "Internal server error"}, 500
-    
-def plex_resume(data):
-    try:
-        if data and 'source_metadata_details' in data and 'stream_details' in data and 'server_info' in data:
-            source_metadata = data['source_metadata_details']
-            stream_details = data['stream_details']
-            server_info = data['server_info']
-            
-            media_type = source_metadata.get('media_type', '').capitalize()
-            title = source_metadata.get('title', '')
-            if media_type == 'Movie':
-                title = f"{title} ({source_metadata.get('year')})"
-                color = 16753920
-                logger.info(f"Created Movie Resume embed for {source_metadata.get('title')} ({source_metadata.get('year')})")
-            elif media_type == 'Episode':
-                title = f"{title} (S{source_metadata.get('season_num00')}E{source_metadata.get('episode_num00')})"
-                color = 6719185
-                logger.info(f"Created Episode Resume embed for {source_metadata.get('show_title')} (S{source_metadata.get('season_num00')}E{source_metadata.get('episode_num00')})")
-            
-            embed = {
-                'color': color,
-                'author': {'name': f"Plex - Streaming {media_type}", 'icon_url': PLEX_ICON_URL},
-                'thumbnail': {'url': source_metadata.get('poster_url', '')},
-                'title': title,
-                'timestamp': server_info.get('utctime'),
-                'url': source_metadata.get('imdb_url', ''),
-                'footer': {
-                    'text': f"{server_info.get('server_name')} | {stream_details.get('username')} | {stream_details.get('product')} | {stream_details.get('video_decision', '').title()}"
-                },
-                'image': {'url': DISCORD_THUMBNAIL},
-                'fields': [
-                    {
-                        'name': ':play_pause: Resumed Streaming',
-                        'value': f"{stream_details.get('remaining_time', '')[3:]} remaining" if stream_details.get('remaining_time', '').startswith("00:") else f"{stream_details.get('remaining_time', '')} remaining",
-                        'inline': True
-                    }
-                ]
-            }
-            logger.debug(f"Play Resumed embed: {embed}")
-            return {'embeds': [embed]}, 200
-        else:
-            logger.info("Webhook received, but no Source Metadata Details or Stream Details found. Data not saved.")
-            return {'message': "Webhook received, but no Source Metadata Details or Stream Details found. Data not saved."}, 200
-    except Exception as e:
-        logger.error(f"Error while processing JSON payload: {str(e)}")
-        return {'error': "Internal server error"}, 500
-
-def plex_episode_content(data):
-    try:
-        if data and 'source_metadata_details' in data and 'server_info' in data:
-            source_metadata = data['source_metadata_details']
-            server_info = data['server_info']
-
-            if source_metadata.get('media_type') == 'episode':
-                embed = {
-                    'title': f"{source_metadata.get('title')} (S{source_metadata.get('season_num00')}E{source_metadata.get('episode_num00')})",
-                    'description': source_metadata.get('summary', ''),
-                    'url': source_metadata.get('plex_url', ''),
-                    'color': 6719185,
-                    'fields': [
-                        {'name': 'Quality', 'value': source_metadata.get('video_full_resolution', ''), 'inline': True},
-                        {'name': 'Season/Episode', 'value': f"S{source_metadata.get('season_num00')} - E{source_metadata.get('episode_num00')}", 'inline': True},
-                        {'name': 'Air date', 'value': source_metadata.get('air_date', ''), 'inline': True},
-                        {'name': 'Genres', 'value': source_metadata.get('genres', ''), 'inline': True},
-                        {'name': 'Details', 'value': f"📺 [TVDB]({source_metadata.get('thetvdb_url', '')})", 'inline': True},
-                        {'name': 'Runtime', 'value': source_metadata.get('duration_time', '')[3:] if source_metadata.get('duration_time', '').startswith("00:") else source_metadata.get('duration_time', ''), 'inline': True}
-                    ],
-                    'author': {'name': 'Plex - New Episode', 'icon_url': PLEX_ICON_URL},
-                    'footer': {'text': server_info.get('server_name', '')},
-                    'timestamp': server_info.get('utctime', ''),
-                    'thumbnail': {'url': source_metadata.get('poster_url', '')},
-                    'image': {'url': DISCORD_THUMBNAIL}
-                }
-                logger.info(f"Created New Episode embed for {source_metadata.get('title')} (S{source_metadata.get('season_num00')}E{source_metadata.get('episode_num00')})")
-                logger.debug(f"New Episode embed: {embed}")
-                return {'embeds': [embed]}, 200
-            else:
-                logger.info("Webhook received, but no episode details found. Data not saved.")
-                return {'message': "Webhook received, but no episode details found. Data not saved."}, 200
-        else:
-            logger.info("Webhook received, but no Source Metadata Details found. Data not saved.")
-            return {'message': "Webhook received, but no Source Metadata Details found. Data not saved."}, 200
-    except Exception as e:
-        logger.error(f"Error while processing JSON payload: {str(e)}")
-        return {'error': "Internal server error"}, 500
-    
-def plex_season_content(data):
-    try:
-        if data and 'source_metadata_details' in data and 'server_info' in data:
-            source_metadata = data['source_metadata_details']
-            server_info = data['server_info']
-
-            if source_metadata.get('media_type') == 'season':
-                embed = {
-                    'title': source_metadata.get('title'),
-                    'description': source_metadata.get('summary', ''),
-                    'url': source_metadata.get('plex_url', ''),
-                    'color': 6719185,
-                    'fields': [
-                        {'name': 'Season', 'value': source_metadata.get('season_num00'), 'inline': True},
-                        {'name': 'Episodes', 'value': source_metadata.get('episode_count'), 'inline': True},
-                        {'name': 'Details', 'value': f"[IMDb]({source_metadata.get('imdb_url')})", 'inline': True}
-                    ],
-                    'author': {'name': 'Plex - New Season', 'icon_url': PLEX_ICON_URL},
-                    'footer': {'text': server_info.get('server_name', '')},
-                    'timestamp': server_info.get('utctime', ''),
-                    'thumbnail': {'url': source_metadata.get('poster_url', '')},
-                    'image': {'url': DISCORD_THUMBNAIL}
-                }
-                logger.info(f"Created New Season embed for {source_metadata.get('title')} - Season {source_metadata.get('season_num00')}")
-                logger.debug(f"New Season embed: {embed}")
-                return {'embeds': [embed]}, 200
-            else:
-                logger.info("Webhook received, but no Season details found. Data not saved.")
-                return {'message': "Webhook received, but no Season details found. Data not saved."}, 200
-        else:
-            logger.info("Webhook received, but no Source Metadata Details found. Data not saved.")
-            return {'message': "Webhook received, but no Source Metadata Details found. Data not saved."}, 200
-    except Exception as e:
-        logger.error(f"Error while processing JSON payload: {str(e)}")
-        return {'error': "Internal server error"}, 500
-    
-def plex_movie_content(data):
+"""
+Plex notifications are described by templates, one per Tautulli webhook type and
+media type. Every text in a template is a format string over the payload context
+(all fields of the payload plus a few derived values), the templates are compiled
+once at import into render functions that produce the embed dict directly.
+
+Adding a new Tautulli event only takes a new entry in PLEX_TEMPLATES.
+"""
+
+COLOR_MOVIE = 16753920
+COLOR_SHOW = 6719185
+
+STREAM_MOVIE = {
+    'title': '{title} ({year})',
+    'color': COLOR_MOVIE,
+    'author': 'Plex - Streaming Movie',
+    'url': '{imdb_url}',
+    'thumbnail': '{poster_url}',
+    'footer': '{server_name} | {username} | {product} | {video_decision_title}',
+}
+
+STREAM_EPISODE = {
+    **STREAM_MOVIE,
+    'title': '{title} (S{season_num00}E{episode_num00})',
+    'color': COLOR_SHOW,
+    'author': 'Plex - Streaming Episode',
+}
+
+NOW_STREAMING = [(':arrow_forward: Now Streaming', '{remaining} remaining', True)]
+RESUMED_STREAMING = [(':play_pause: Resumed Streaming', '{remaining} remaining', True)]
+
+NEW_CONTENT = {
+    'description': '{summary}',
+    'url': '{plex_url}',
+    'thumbnail': '{poster_url}',
+    'footer': '{server_name}',
+}
+
+# (webhook type, media type) -> template, 'stream' marks templates that need the stream details
+PLEX_TEMPLATES = {
+    ('nowplaying', 'movie'): {**STREAM_MOVIE, 'stream': True, 'fields': NOW_STREAMING},
+    ('nowplaying', 'episode'): {**STREAM_EPISODE, 'stream': True, 'fields': NOW_STREAMING},
+    ('nowresuming', 'movie'): {**STREAM_MOVIE, 'stream': True, 'fields': RESUMED_STREAMING},
+    ('nowresuming', 'episode'): {**STREAM_EPISODE, 'stream': True, 'fields': RESUMED_STREAMING},
+    ('newcontent_episode', 'episode'): {
+        **NEW_CONTENT,
+        'title': '{title} (S{season_num00}E{episode_num00})',
+        'color': COLOR_SHOW,
+        'author': 'Plex - New Episode',
+        'fields': [
+            ('Quality', '{video_full_resolution}', True),
+            ('Season/Episode', 'S{season_num00} - E{episode_num00}', True),
+            ('Air date', '{air_date}', True),
+            ('Genres', '{genres}', True),
+            ('Details', '📺 [TVDB]({thetvdb_url})', True),
+            ('Runtime', '{runtime}', True),
+        ],
+    },
+    ('newcontent_season', 'season'): {
+        **NEW_CONTENT,
+        'title': '{title}',
+        'color': COLOR_SHOW,
+        'author': 'Plex - New Season',
+        'fields': [
+            ('Season', '{season_num00}', True),
+            ('Episodes', '{episode_count}', True),
+            ('Details', '[IMDb]({imdb_url})', True),
+        ],
+    },
+    ('newcontent_movie', 'movie'): {
+        **NEW_CONTENT,
+        'title': '{title} ({year})',
+        'color': COLOR_MOVIE,
+        'author': 'Plex - New Movie',
+        'fields': [
+            ('Quality', '{video_full_resolution}', True),
+            ('Genres', '{genres}', True),
+            ('Release date', '{release_date}', True),
+            ('Rotten Tomatoes', ':popcorn: {rating}', True),
+            ('Details', '[IMDb]({imdb_url})', True),
+            ('Runtime', '{runtime}', True),
+        ],
+    },
+}
+
+# Function to strip empty hours from a duration, e.g. 00:42:10 -> 42:10
+def strip_hours(duration):
+    return duration[3:] if duration.startswith("00:") else duration
+
+# Function to build the context the templates are rendered with, every value is computed once
+def build_context(payload):
+    context = msgspec.structs.asdict(payload.source_metadata_details)
+    context.update(msgspec.structs.asdict(payload.server_info))
+    if payload.stream_details is not None:
+        context.update(msgspec.structs.asdict(payload.stream_details))
+        context['remaining'] = strip_hours(payload.stream_details.remaining_time)
+        context['video_decision_title'] = payload.stream_details.video_decision.title()
+    context['runtime'] = strip_hours(context['duration_time'])
+    return context
+
+# Function to compile a template text, texts without placeholders are returned as is
+def compile_text(text):
+    if '{' not in text:
+        return lambda context: text
+    return text.format_map
+
+# Function to compile a template into a function rendering the embed dict from a context
+def compile_template(template):
+    render_title = compile_text(template['title'])
+    render_url = compile_text(template['url'])
+    render_thumbnail = compile_text(template['thumbnail'])
+    render_footer = compile_text(template['footer'])
+    render_description = compile_text(template['description']) if 'description' in template else None
+    render_fields = [(compile_text(name), compile_text(value), inline) for name, value, inline in template['fields']]
+    color = template['color']
+    author_name = template['author']
+
+    def render(context):
+        embed = {
+            'title': render_title(context),
+            'url': render_url(context),
+            'color': color,
+            'fields': [
+                {'name': render_name(context), 'value': render_value(context), 'inline': inline}
+                for render_name, render_value, inline in render_fields
+            ],
+            'author': {'name': author_name, 'icon_url': PLEX_ICON_URL},
+            'footer': {'text': render_footer(context)},
+            'timestamp': context['utctime'],
+            'thumbnail': {'url': render_thumbnail(context)},
+            'image': {'url': DISCORD_THUMBNAIL}
+        }
+        if render_description is not None:
+            embed['description'] = render_description(context)
+        return embed
+
+    return render
+
+# (webhook type, media type) -> (render function, author name, needs stream details)
+PLEX_RENDERERS = {
+    key: (compile_template(template), template['author'], template.get('stream', False))
+    for key, template in PLEX_TEMPLATES.items()
+}
+
+# Function to render the embed for a Tautulli webhook, returns None if there is nothing to send
+def plex_embed(payload):
+    source_metadata = payload.source_metadata_details
+    if source_metadata is None:
+        logger.info("Webhook received, but no Source Metadata Details found. Data not saved.")
+        return None
+    webhook_type = payload.server_info.webhook_type
+    renderer = PLEX_RENDERERS.get((webhook_type, source_metadata.media_type))
+    if renderer is None:
+        logger.info(f"Webhook received, but no {webhook_type} template for media type '{source_metadata.media_type}'. Data not saved.")
+        return None
+    render, author_name, needs_stream = renderer
+    if needs_stream and payload.stream_details is None:
+        logger.info("Webhook received, but no Stream Details found. Data not saved.")
+        return None
     try:
-        if data and 'source_metadata_details' in data and 'server_info' in data:
-            source_metadata = data['source_metadata_details']
-            server_info = data['server_info']
-
-            if source_metadata.get('media_type') == 'movie':
-                embed = {
-                    'title': f"{source_metadata.get('title')} ({source_metadata.get('year')})",
-                    'description': source_metadata.get('summary', ''),
-                    'url': source_metadata.get('plex_url', ''),
-                    'color': 16753920,
-                    'fields': [
-                        {'name': 'Quality', 'value': source_metadata.get('video_full_resolution', ''), 'inline': True},
-                        {'name': 'Genres', 'value': source_metadata.get('genres', ''), 'inline': True},
-                        {'name': 'Release date', 'value': source_metadata.get('release_date', ''), 'inline': True},
-                        {'name': 'Rotten Tomatoes', 'value': f":popcorn: {source_metadata.get('rating')}", 'inline': True},
-                        {'name': 'Details', 'value': f"[IMDb]({source_metadata.get('imdb_url')})", 'inline': True},
-                        {'name': 'Runtime', 'value': source_metadata.get('duration_time', '')[3:] if source_metadata.get('duration_time', '').startswith("00:") else source_metadata.get('duration_time', ''), 'inline': True}
-                    ],
-                    'author': {'name': 'Plex - New Movie', 'icon_url': f'{PLEX_ICON_URL}'},
-                    'footer': {'text': server_info.get('server_name', '')},
-                    'timestamp': server_info.get('utctime', ''),
-                    'thumbnail': {'url': source_metadata.get('poster_url', '')},
-                    'image': {'url': f'{DISCORD_THUMBNAIL}'}
-                }
-                logger.info(f"Created New Movie embed for {source_metadata.get('title')} ({source_metadata.get('year')})")
-                logger.debug(f"New Movie embed: {embed}")
-                return {'embeds': [embed]}, 200
-            else:
-                logger.info("Webhook received, but no Movie details found. Data not saved.")
-                return {'message': "Webhook received, but no Movie details found. Data not saved."}, 200
-        else:
-            logger.info("Webhook received, but no Source Metadata Details found. Data not saved.")
-            return {'message': "Webhook received, but no Source Metadata Details found. Data not saved."}, 200
-    except Exception as e:
-        logger.error(f"Error while processing JSON payload: {str(e)}")
-        return {'error': "Internal server error"}, 500
\ No newline at end of file
+        embed = render(build_context(payload))
+    except (KeyError, ValueError) as e:
+        logger.error(f"Error while rendering {webhook_type} template: {e}")
+        return None
+    logger.info(f"Created {author_name} embed for {embed['title']}")
+    logger.debug(f"{author_name} embed: {embed}")
+    return embed
@@ -1,14 +1,13 @@
 import discord
 from discord.utils import utcnow
-import requests
 
 from src.globals import (
-    TMDB_API_KEY, 
     RADARR_ICON_URL, 
     DISCORD_THUMBNAIL
 )
 
 from .custom_logger import logger
+from .tmdb import get_poster_path
 
 def convert_bytes_to_human_readable(size_in_bytes):
     if size_in_bytes == 0:
@@ -20,32 +19,19 @@ def convert_bytes_to_human_readable(size_in_bytes):
         result = size_in_bytes / (1024 ** 3)
         return "{:.2f}GB".format(result)
 
-def get_tmdb_poster_path(tmdb_id):
-    tmdb_api_key = TMDB_API_KEY
-    tmdb_url = f"https://api.themoviedb.org/3/movie/{tmdb_id}?api_key={tmdb_api_key}&language=en-US"
-    try:
-        response = requests.get(tmdb_url)
-        response.raise_for_status()
-        tmdb_data = response.json()
-        poster_path = tmdb_data.get("poster_path")
-        return poster_path
-    except requests.exceptions.RequestException as e:
-        logger.info(f"Error fetching data from TMDB: {str(e)}")
-        return None
-
-def create_radarr_embed(json_data):
-    event_type = json_data.get('eventType', 'N/A')
-    instance_name = json_data.get('instanceName', 'N/A')
+async def create_radarr_embed(payload):
+    event_type = payload.event_type
+    instance_name = payload.instance_name
     embed_data = {}
 
     if event_type == "Test":
         embed_data = create_test_embed(instance_name)
     elif event_type == "Grab":
-        embed_data = create_grab_embed(json_data, instance_name)
+        embed_data = await create_grab_embed(payload, instance_name)
     elif event_type == "MovieDelete":
-        embed_data = create_movie_delete_embed(json_data, instance_name)
+        embed_data = await create_movie_delete_embed(payload, instance_name)
     elif event_type == "ApplicationUpdate":
-        embed_data = create_application_update_embed(json_data, instance_name)
+        embed_data = create_application_update_embed(payload, instance_name)
     else:
         embed_data = create_unknown_event_embed(event_type)
         logger.warning(f"Unknown event type: {event_type}")
@@ -64,21 +50,17 @@ def create_test_embed(instance_name):
     embed.set_image(url=DISCORD_THUMBNAIL)
     return embed.to_dict()
 
-def create_grab_embed(json_data, instance_name):
-    movie_title = json_data['movie'].get('title', 'N/A')
-    movie_year = json_data['movie'].get('year', 'N/A')
-    release_data = json_data.get('release', {})
-    release_quality = release_data.get('quality', 'N/A')
-    release_size_bytes = release_data.get('size', 'N/A')
-    release_size_human_readable = convert_bytes_to_human_readable(release_size_bytes)
-    release_title = release_data.get('releaseTitle', 'N/A')
-    release_indexer = release_data.get('indexer', 'N/A')
-    indexer_words = release_indexer.split()
-    indexer_value = "\n".join(indexer_words)
-    custom_format_score = release_data.get('customFormatScore', 'N/A')
-    custom_formats = release_data.get('customFormats', [])
-    tmdb_id = json_data['movie'].get('tmdbId', 'N/A')
-    poster_path = get_tmdb_poster_path(tmdb_id)
+async def create_grab_embed(payload, instance_name):
+    movie_title = payload.movie.title
+    movie_year = payload.movie.year
+    release_data = payload.release
+    release_quality = release_data.quality
+    release_size_human_readable = convert_bytes_to_human_readable(release_data.size)
+    release_title = release_data.release_title
+    indexer_value = format_indexer_value(release_data.indexer)
+    custom_format_score = release_data.custom_format_score
+    custom_formats = release_data.custom_formats
+    poster_path = await get_poster_path('movie', payload.movie.tmdb_id)
     embed = discord.Embed(
         title=f"{movie_title} ({movie_year})",
         color=0xffa500
@@ -99,14 +81,12 @@ def create_grab_embed(json_data, instance_name):
     embed.set_image(url=DISCORD_THUMBNAIL)
     return embed.to_dict()
 
-def create_movie_delete_embed(json_data, instance_name):
-    movie_title = json_data['movie'].get('title', 'N/A')
-    movie_year = json_data['movie'].get('year', 'N/A')
-    folder_path = json_data['movie'].get('folderPath', 'N/A')
-    folder_size = json_data.get('movieFolderSize', 'N/A')
-    folder_size_human_readable = convert_bytes_to_human_readable(folder_size)
-    tmdb_id = json_data['movie'].get('tmdbId', 'N/A')
-    poster_path = get_tmdb_poster_path(tmdb_id)
+async def create_movie_delete_embed(payload, instance_name):
+    movie_title = payload.movie.title
+    movie_year = payload.movie.year
+    folder_path = payload.movie.folder_path
+    folder_size_human_readable = convert_bytes_to_human_readable(payload.movie_folder_size)
+    poster_path = await get_poster_path('movie', payload.movie.tmdb_id)
     embed = discord.Embed(
         title=f"{movie_title} ({movie_year})",
         color=0xFF0000
@@ -121,9 +101,9 @@ def create_movie_delete_embed(json_data, instance_name):
     embed.set_image(url=DISCORD_THUMBNAIL)
     return embed.to_dict()
 
-def create_application_update_embed(json_data, instance_name):
-    old_version = json_data.get('previousVersion', 'N/A')
-    new_version = json_data.get('newVersion', 'N/A')
+def create_application_update_embed(payload, instance_name):
+    old_version = payload.previous_version
+    new_version = payload.new_version
     embed = discord.Embed(
         color=0x00ff00
     )
@@ -0,0 +1,25 @@
+import asyncio
+import time
+
+"""
+Request budget shared by concurrent callers of an API.
+"""
+
+class RateLimiter:
+    """
+    Spaces calls to acquire() at least 1 / `rate` seconds apart, however many
+    tasks call it concurrently. Every caller reserves the next free slot and
+    sleeps until it, so the budget holds for the API as a whole instead of per
+    task.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_slot = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(self.next_slot, now)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
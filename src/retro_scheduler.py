@@ -0,0 +1,85 @@
+import asyncio
+import heapq
+import time
+
+from config import RETRO_POLL_MIN_INTERVAL, RETRO_POLL_MAX_INTERVAL
+
+from .custom_logger import logger
+
+"""
+Adaptive polling of the RetroAchievements users.
+
+Every user has its own poll interval and the users wait for their next poll in
+a priority queue ordered by due time. A poll that posts new achievements resets
+the user's interval to RETRO_POLL_MIN_INTERVAL, so an active player's unlocks
+are posted within minutes. A poll that finds nothing (or fails) doubles the
+interval, up to RETRO_POLL_MAX_INTERVAL for players that have been idle for a
+while. Polls that are due at the same time run concurrently, the request
+budget of the RetroAchievements client keeps them within the API limits.
+"""
+
+BACKOFF_FACTOR = 2
+
+# Heap of (due time (monotonic), username), users that are being polled are not in it
+schedule = []
+
+# Username -> current poll interval in seconds
+intervals = {}
+
+# Set whenever a user is put back on the schedule, so the scheduler can wake up early
+rescheduled = asyncio.Event()
+
+# The scheduler task and the polls it started, referenced so they aren't garbage collected
+tasks = {'scheduler': None, 'polls': set()}
+
+def reschedule(username, due):
+    heapq.heappush(schedule, (due, username))
+    rescheduled.set()
+
+def next_interval(username, posted):
+    if posted:
+        return RETRO_POLL_MIN_INTERVAL * 60
+    return min(intervals[username] * BACKOFF_FACTOR, RETRO_POLL_MAX_INTERVAL * 60)
+
+async def run_poll(poll, username):
+    try:
+        posted = await poll(username)
+    except Exception as e:
+        logger.error(f'An error occurred while fetching retroachievements for {username}: {e}')
+        posted = 0
+    intervals[username] = next_interval(username, posted)
+    logger.debug(f'Polling {username} again in {intervals[username] / 60:.0f} minutes')
+    reschedule(username, time.monotonic() + intervals[username])
+
+async def run_scheduler(poll):
+    while True:
+        rescheduled.clear()
+        if not schedule:
+            # Every user is being polled, wait until one of them is put back
+            await rescheduled.wait()
+            continue
+        due, username = schedule[0]
+        delay = due - time.monotonic()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(rescheduled.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        heapq.heappop(schedule)
+        task = asyncio.create_task(run_poll(poll, username))
+        tasks['polls'].add(task)
+        task.add_done_callback(tasks['polls'].discard)
+
+# Function to start polling the users, poll(username) returns the number of posted achievements
+def start_scheduler(poll, usernames):
+    # on_ready runs again after a reconnect, the scheduler keeps running
+    if tasks['scheduler'] is not None and not tasks['scheduler'].done():
+        return
+    now = time.monotonic()
+    for username in usernames:
+        if username not in intervals:
+            intervals[username] = RETRO_POLL_MIN_INTERVAL * 60
+            reschedule(username, now)
+    tasks['scheduler'] = asyncio.create_task(run_scheduler(poll))
+    logger.info(f"Started the RetroAchievements scheduler for {len(intervals)} users")
@@ -1,11 +1,15 @@
-import requests
 import discord
 from discord.utils import utcnow
 from datetime import datetime, timedelta
+import calendar
 import collections
+import json
+import os
 import time
 from dateutil.parser import parse
 
+from config import RETRO_REQUESTS_PER_SECOND, RETRO_GAME_CACHE_SIZE, RETRO_GAME_CACHE_TTL, RETRO_MASTERY_RECONCILE
+
 from .globals import (
     DISCORD_THUMBNAIL,
     RETRO_USERNAME,
@@ -15,6 +19,9 @@ from .globals import (
 )
 
 from .custom_logger import logger
+from .http_client import get_json, RequestError
+from .rate_limit import RateLimiter
+from .cache import TTLCache, data_path
 
 '''
 Start of utility functions
@@ -42,54 +49,135 @@ def set_footer(embed, username, text):
     else:
         embed.set_footer(text=text)
 
+'''
+Start of functions to keep track of the posted achievements and masteries
+'''
+
+RETRO_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def load_state(filename):
+    file_path = data_path(filename)
+    try:
+        with open(file_path, 'r') as f:
+            state = json.load(f)
+            logger.info(f"Successfully loaded data from {file_path}")
+            return state
+    except FileNotFoundError:
+        logger.info(f"File {file_path} not found. Skipping loading.")
+        return {}
+
+def save_state(filename, state):
+    file_path = data_path(filename)
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, file_path)
+    logger.debug(f"Successfully saved data to {file_path}")
+
+# Username -> [date, achievement id] of the newest posted achievement, the dates sort chronologically as text
+watermarks = load_state('retro_watermarks.json')
+
+# Username -> {'games': ids of the mastered games, 'reconciled_at': unix time of the last full count}
+masteries = load_state('retro_masteries.json')
+
+# Function to get the (date, achievement id) of the newest posted achievement of a user
+def get_watermark(username):
+    watermark = watermarks.get(username)
+    if watermark is None:
+        # A new user starts with the achievements of the last RETRO_TIMEFRAME minutes
+        return ((datetime.utcnow() - timedelta(minutes=RETRO_TIMEFRAME)).strftime(RETRO_DATE_FORMAT), 0)
+    return tuple(watermark)
+
+# Function to remember that an achievement was posted, called after every message so a restart never posts it again
+def set_watermark(username, watermark):
+    if username not in watermarks or tuple(watermark) > get_watermark(username):
+        watermarks[username] = list(watermark)
+        save_state('retro_watermarks.json', watermarks)
+
+def is_mastered(game):
+    return game['NumAwardedHardcore'] == game['MaxPossible'] or game['HighestAwardKind'] == 'mastered'
+
+# Function to count the masteries of a user, including the game that was just completed
+def count_masteries(username, completion, game_id):
+    state = masteries.get(username)
+    if state is None or time.time() - state['reconciled_at'] > RETRO_MASTERY_RECONCILE:
+        # Recounted from the completion snapshot of this cycle, which is already downloaded
+        state = {'games': sorted(game for game, details in completion.items() if is_mastered(details)), 'reconciled_at': time.time()}
+    elif is_mastered(completion[game_id]) and game_id not in state['games']:
+        state['games'].append(game_id)
+    masteries[username] = state
+    save_state('retro_masteries.json', masteries)
+    return len(state['games'])
+
 '''
 Start of functions to fetch data from the RetroAchievements API
 '''
 
+# Game id -> metadata of API_GetGameExtended that the embeds use
+game_cache = TTLCache(RETRO_GAME_CACHE_SIZE, ttl=RETRO_GAME_CACHE_TTL, filename='retro_games.json')
+game_cache.load()
+
+# All users are polled concurrently, so every API call takes a slot of one shared budget
+request_budget = RateLimiter(RETRO_REQUESTS_PER_SECOND)
+
+# Function to call the RetroAchievements API within the request budget, raises RequestError on failure
+async def get_api_json(url, params):
+    await request_budget.acquire()
+    return await get_json('retroachievements', url, params=params)
+
 # Main function to fetch the recent achievements for all target usernames
-def fetch_recent_achievements(completion_cache, username):
-    data = fetch_data(username)
+async def fetch_recent_achievements(username):
+    data = await fetch_data(username)
     if data is not None:
         new_achievements_count = collections.defaultdict(int)
         embeds = []
         game_completion_checked = set()
+        # Completion progress of all games of the user, downloaded at most once per cycle and only if there are achievements
+        completion = None
+        refreshed = False
         for achievement in data:
             game_id = achievement['GameID']
-            if username not in completion_cache:
-                completion_cache[username] = {}
-            if game_id not in completion_cache[username]:
-                completion_cache[username][game_id] = fetch_completion(username)
-            embed = create_embed(achievement, completion_cache[username][game_id], new_achievements_count[game_id], username)
+            if completion is None:
+                completion = await fetch_completion(username) or {}
+            elif game_id not in completion and not refreshed:
+                # The game was started after the snapshot was taken, one refresh covers every new game of this cycle
+                completion.update(await fetch_completion(username) or {})
+                refreshed = True
+            embed = create_embed(achievement, completion, new_achievements_count[game_id], username)
             new_achievements_count[game_id] += 1
 
             # Add the achievement embed
-            achievement_time = datetime.strptime(achievement['Date'], '%Y-%m-%d %H:%M:%S')
-            embeds.append((achievement_time, embed))
+            achievement_time = datetime.strptime(achievement['Date'], RETRO_DATE_FORMAT)
+            watermark = (achievement['Date'], achievement['AchievementID'])
+            embeds.append(((achievement_time, watermark, 0), embed, watermark))
 
             # Check if the game is completed, but only if it hasn't been checked before
             if game_id not in game_completion_checked:
-                completion_embed = check_game_completion(username, completion_cache[username][game_id], achievement)
+                completion_embed = await check_game_completion(username, completion, achievement)
                 if completion_embed is not None:
-                    # Add a small delay to the completion time to ensure it's always after the last achievement
-                    completion_time = achievement_time + timedelta(seconds=1)
-                    embeds.append((completion_time, completion_embed))
+                    # The first achievement of a game in the data is its newest, the completion is sorted right after it
+                    embeds.append(((achievement_time, watermark, 1), completion_embed, watermark))
                 game_completion_checked.add(game_id)
 
+        # Oldest first, so the watermark only moves forward while the messages are sent, messages sharing a watermark are adjacent
         embeds.sort(key=lambda x: x[0])
-        return [embed.to_dict() for _, embed in embeds]
+        return [(embed.to_dict(), watermark) for _, embed, watermark in embeds]
     else:
         return None
 
 # Fetch daily overview for a user
-def create_daily_overview(username):
+async def create_daily_overview(username):
     logger.debug(f"Fetching daily overview for {username}")
     now = int(time.time())
     yesterday = now - 24*60*60
     url = f"https://retroachievements.org/API/API_GetAchievementsEarnedBetween.php?u={username}"
     params = {'z': RETRO_USERNAME, 'y': RETRO_API_KEY, 'f': yesterday, 't': now}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        achievements = response.json()
+    try:
+        achievements = await get_api_json(url, params)
+    except RequestError as e:
+        logger.error(f"Error fetching daily overview: {e}")
+        return None
+    else:
         daily_points = 0
         max_points = 0
         max_achievement = None
@@ -102,78 +190,76 @@ def create_daily_overview(username):
         logger.debug(f"Daily points: {daily_points}")
         
         # Fetch user profile
-        total_points, total_retropoints = get_user_profile(username)
+        total_points, total_retropoints = await get_user_profile(username)
         if total_points is not None and total_retropoints is not None:
             embed = create_daily_overview_embed(username, daily_points, total_points, total_retropoints, achievements, max_achievement)
             logger.debug(f"Embed created: {embed.to_dict()}")
             return embed
-    else:
-        logger.error(f"Error fetching daily overview: {response.status_code}")
-        return None
 
 # Fetch Total Points and Total True Points for a user
-def get_user_profile(username):
+async def get_user_profile(username):
     url = f"https://retroachievements.org/API/API_GetUserProfile.php?u={username}"
     params = {'z': RETRO_USERNAME, 'y': RETRO_API_KEY}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        user_profile = response.json()
-        total_points = user_profile['TotalPoints']
-        total_true_points = user_profile['TotalTruePoints']
-        return total_points, total_true_points
-    else:
-        logger.error(f"Error fetching user profile: {response.status_code}")
+    try:
+        user_profile = await get_api_json(url, params)
+    except RequestError as e:
+        logger.error(f"Error fetching user profile: {e}")
         return None, None
-
-# Function to fetch the number of hardcore completions for a user
-def fetch_completed_games(username):
-    url = 'https://retroachievements.org/API/API_GetUserCompletionProgress.php'
-    params = {'z': RETRO_USERNAME, 'y': RETRO_API_KEY, 'u': username}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        completion_progress = response.json()
-        logger.debug(f'Completion Progress: {completion_progress}')
-        mastered_games = sum(1 for game in completion_progress['Results'] if game['NumAwardedHardcore'] == game['MaxPossible'] or game['HighestAwardKind'] == 'mastered')
-        return mastered_games
-    else:
-        logger.debug(f'Error: {response.status_code}')
-        return None
+    total_points = user_profile['TotalPoints']
+    total_true_points = user_profile['TotalTruePoints']
+    return total_points, total_true_points
 
 # Function to fetch the completion status of a user for a specific game
-def fetch_completion(username):
+async def fetch_completion(username):
     url = 'https://retroachievements.org/API/API_GetUserCompletionProgress.php'
     params = {'z': RETRO_USERNAME, 'y': RETRO_API_KEY, 'u': username}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return {game['GameID']: game for game in response.json()['Results']}
-    else:
-        logger.debug(f'Error: {response.status_code}')
+    try:
+        completion_progress = await get_api_json(url, params)
+    except RequestError as e:
+        logger.debug(f'Error: {e}')
         return None
-
-# Function to fetch the recent achievements for a user
-def fetch_data(username):
-    url = 'https://retroachievements.org/API/API_GetUserRecentAchievements.php'
-    params = {'z': RETRO_USERNAME, 'y': RETRO_API_KEY, 'u': username, 'm': RETRO_TIMEFRAME}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        logger.debug(f'Data fetched successfully: {response.json()}')
-        return response.json()
-    else:
-        logger.debug(f'Error: {response.status_code}')
+    return {game['GameID']: game for game in completion_progress['Results']}
+
+# Function to fetch the achievements of a user that are newer than the watermark, newest first
+async def fetch_data(username):
+    watermark = get_watermark(username)
+    url = 'https://retroachievements.org/API/API_GetAchievementsEarnedBetween.php'
+    # The dates of the API are UTC, the watermark's own second is requested again and filtered below
+    since = calendar.timegm(datetime.strptime(watermark[0], RETRO_DATE_FORMAT).timetuple())
+    until = int(time.time())
+    params = {'z': RETRO_USERNAME, 'y': RETRO_API_KEY, 'u': username, 'f': since, 't': until}
+    try:
+        data = await get_api_json(url, params)
+    except RequestError as e:
+        logger.debug(f'Error: {e}')
         return None
-    
-def fetch_game_data(game_id):
+    logger.debug(f'Data fetched successfully: {data}')
+    new_achievements = [achievement for achievement in data if (achievement['Date'], achievement['AchievementID']) > watermark]
+    if username not in watermarks:
+        # Stored at the first poll, otherwise the window of a new user slides along with the polls and misses what
+        # was earned between them. With new achievements it stays at the window start until they were posted.
+        set_watermark(username, watermark if new_achievements else (datetime.utcfromtimestamp(until).strftime(RETRO_DATE_FORMAT), 0))
+    return sorted(new_achievements, key=lambda x: (x['Date'], x['AchievementID']), reverse=True)
+
+# Function to get the metadata of a game ('points_total'), cached on disk because it hardly ever changes
+async def fetch_game_data(game_id):
+    game_data = game_cache.get(game_id)
+    if game_data is not None:
+        return game_data
     url = "https://retroachievements.org/API/API_GetGameExtended.php"
     params = {'z': RETRO_USERNAME, 'y': RETRO_API_KEY, 'i': game_id}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        logger.debug(f'Error: {response.status_code}')
+    try:
+        data = await get_api_json(url, params)
+    except RequestError as e:
+        logger.debug(f'Error: {e}')
         return None
+    game_data = {'points_total': data['points_total']}
+    game_cache.set(game_id, game_data)
+    game_cache.save_later()
+    return game_data
     
 # Function to check if a game has been completed
-def check_game_completion(username, completion, achievement):
+async def check_game_completion(username, completion, achievement):
     game_id = achievement['GameID']
     if game_id in completion:
         game_details = completion[game_id]
@@ -181,10 +267,9 @@ def check_game_completion(username, completion, achievement):
         max_possible = int(game_details['MaxPossible'])
         highest_award_date = game_details['HighestAwardDate']
         if num_awarded == max_possible:
-            completed_games_count = fetch_completed_games(username)
-            game_data = fetch_game_data(game_id)
-            if game_data is not None:
-                points_earned = game_data['points_total']
+            completed_games_count = count_masteries(username, completion, game_id)
+            game_data = await fetch_game_data(game_id)
+            points_earned = game_data['points_total'] if game_data is not None else 'Unknown'
             achievements_earned = max_possible
             return create_embed_if_game_completed(username, completed_games_count, game_id, achievement, highest_award_date, achievements_earned, points_earned)
     return None
@@ -241,7 +326,7 @@ def create_embed(achievement, completion_cache, new_achievements_count, username
     embed.set_author(name="Achievement Unlocked", icon_url=f"https://media.retroachievements.org{achievement['GameIcon']}")
 
     # Check if the achievement type is "Missable"
-    suffix = " (m)" if achievement['Type'] == 'missable' else ""
+    suffix = " (m)" if achievement.get('Type') == 'missable' else ""
     # Add the achievement link to the embed
     achievement_link = f"[{achievement['Title']}](https://retroachievements.org/achievement/{achievement['AchievementID']})"
     embed.add_field(name="Achievement", value=f"{achievement_link}{suffix}", inline=True)
@@ -0,0 +1,121 @@
+from typing import Optional
+
+import msgspec
+
+"""
+Payload schemas for the incoming webhooks.
+
+The raw request body is decoded in one pass straight into these structs, fields
+that aren't listed here are skipped by the decoder and a payload that doesn't
+match its schema raises msgspec.ValidationError, which is returned as a 400.
+"""
+
+# Sonarr / Radarr payloads use camelCase keys, rename='camel' maps them to snake_case attributes
+class ArrRelease(msgspec.Struct, rename='camel'):
+    quality: str = 'N/A'
+    size: int = 0
+    release_title: str = 'N/A'
+    indexer: str = 'N/A'
+    custom_format_score: Optional[int] = None
+    custom_formats: list[str] = []
+
+class SonarrSeries(msgspec.Struct, rename='camel'):
+    id: int = 0
+    title: str = 'N/A'
+    tvdb_id: Optional[int] = None
+
+class SonarrEpisode(msgspec.Struct, rename='camel'):
+    id: int = 0
+    episode_number: int = 0
+    season_number: int = 0
+    title: str = 'N/A'
+
+class SonarrEpisodeFile(msgspec.Struct, rename='camel'):
+    id: int = 0
+    path: str = 'N/A'
+    size: int = 0
+
+class SonarrPayload(msgspec.Struct, rename='camel'):
+    event_type: str
+    instance_name: str = 'N/A'
+    series: Optional[SonarrSeries] = None
+    episodes: list[SonarrEpisode] = []
+    release: ArrRelease = msgspec.field(default_factory=ArrRelease)
+    episode_file: SonarrEpisodeFile = msgspec.field(default_factory=SonarrEpisodeFile)
+    download_id: Optional[str] = None
+    previous_version: str = 'N/A'
+    new_version: str = 'N/A'
+
+    def __post_init__(self):
+        if self.event_type in ('Grab', 'EpisodeFileDelete') and (self.series is None or not self.episodes):
+            raise ValueError(f"{self.event_type} event without series or episodes")
+
+class RadarrMovie(msgspec.Struct, rename='camel'):
+    id: int = 0
+    title: str = 'N/A'
+    year: int = 0
+    tmdb_id: Optional[int] = None
+    folder_path: str = 'N/A'
+
+class RadarrPayload(msgspec.Struct, rename='camel'):
+    event_type: str
+    instance_name: str = 'N/A'
+    movie: Optional[RadarrMovie] = None
+    release: ArrRelease = msgspec.field(default_factory=ArrRelease)
+    download_id: Optional[str] = None
+    movie_folder_size: int = 0
+    previous_version: str = 'N/A'
+    new_version: str = 'N/A'
+
+    def __post_init__(self):
+        if self.event_type in ('Grab', 'MovieDelete') and self.movie is None:
+            raise ValueError(f"{self.event_type} event without movie")
+
+# Tautulli payloads follow the JSON templates in the README, every value is a string
+class PlexServerInfo(msgspec.Struct):
+    webhook_type: str = ''
+    server_name: str = ''
+    utctime: str = ''
+
+class PlexStreamDetails(msgspec.Struct):
+    username: str = ''
+    product: str = ''
+    video_decision: str = ''
+    remaining_time: str = ''
+    session_key: str = ''
+
+class PlexSourceMetadata(msgspec.Struct):
+    media_type: str = ''
+    title: str = ''
+    show_name: str = ''
+    year: str = ''
+    season_num00: str = ''
+    episode_num00: str = ''
+    episode_count: str = ''
+    summary: str = ''
+    genres: str = ''
+    rating: str = ''
+    air_date: str = ''
+    release_date: str = ''
+    duration_time: str = ''
+    video_full_resolution: str = ''
+    poster_url: str = ''
+    plex_url: str = ''
+    imdb_url: str = ''
+    thetvdb_url: str = ''
+    rating_key: str = ''
+
+class PlexPayload(msgspec.Struct):
+    server_info: PlexServerInfo
+    stream_details: Optional[PlexStreamDetails] = None
+    source_metadata_details: Optional[PlexSourceMetadata] = None
+
+class WatchtowerPayload(msgspec.Struct):
+    message: str
+    title: str = ''
+
+# Decoders are created once, msgspec compiles the schema on creation
+sonarr_decoder = msgspec.json.Decoder(SonarrPayload)
+radarr_decoder = msgspec.json.Decoder(RadarrPayload)
+plex_decoder = msgspec.json.Decoder(PlexPayload)
+watchtower_decoder = msgspec.json.Decoder(WatchtowerPayload)
@@ -0,0 +1,100 @@
+import asyncio
+
+from config import EMBED_BATCHING, EMBED_BATCH_WINDOW
+
+from .custom_logger import logger
+
+"""
+Per-channel scheduler for Discord messages.
+
+Every channel gets its own lane, so a burst in one channel never delays another.
+Discord rate limits message sends per channel (the channel id is the major
+parameter of the route bucket), and discord.py tracks the X-RateLimit headers of
+every bucket and only waits when a bucket is exhausted. A lane therefore sends
+as fast as its bucket allows, without a fixed sleep between messages.
+
+Embeds can optionally be batched per channel, so up to 10 embeds share a
+single message instead of costing one API call each.
+"""
+
+# Discord limits for a single message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARACTERS = 6000
+
+# Mapping of channel id to the queue and task of its lane
+lanes = {}
+lane_tasks = {}
+
+# Mapping of channel id to the embeds waiting to be sent and the timer that flushes them
+batches = {}
+batch_timers = {}
+
+async def run_lane(channel_id, lane):
+    while True:
+        action, future = await lane.get()
+        try:
+            result = await action()
+        except Exception as e:
+            logger.error(f"Error delivering message to channel {channel_id}: {e}")
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            lane.task_done()
+
+# Mark the exception of a future as retrieved, so fire-and-forget sends don't warn twice
+def consume_exception(future):
+    if not future.cancelled():
+        future.exception()
+
+# Function to queue a coroutine function on the lane of a channel, returns a future with its result
+def submit(channel, action):
+    lane = lanes.get(channel.id)
+    if lane is None:
+        lane = lanes[channel.id] = asyncio.Queue()
+        lane_tasks[channel.id] = asyncio.create_task(run_lane(channel.id, lane))
+    future = asyncio.get_running_loop().create_future()
+    future.add_done_callback(consume_exception)
+    lane.put_nowait((action, future))
+    return future
+
+# Function to queue a message for a channel, await the result to get the sent message
+def send(channel, **kwargs):
+    return submit(channel, lambda: channel.send(**kwargs))
+
+# Function to queue an edit of a message, ordered with the other messages of its channel
+def edit(channel, message, **kwargs):
+    return submit(channel, lambda: message.edit(**kwargs))
+
+# Function to send the buffered embeds of a channel as one message
+def flush_batch(channel):
+    timer = batch_timers.pop(channel.id, None)
+    if timer is not None:
+        timer.cancel()
+    embeds = batches.pop(channel.id, None)
+    if embeds:
+        send(channel, embeds=embeds)
+
+# Function to queue an embed for a channel, batched with other embeds when EMBED_BATCHING is enabled
+def send_embed(channel, embed):
+    if not EMBED_BATCHING:
+        send(channel, embed=embed)
+        return
+    batch = batches.get(channel.id)
+    # Discord caps the combined text of all embeds in a message, so start a new batch if it would overflow
+    if batch and sum(len(queued) for queued in batch) + len(embed) > MAX_EMBED_CHARACTERS:
+        flush_batch(channel)
+        batch = None
+    if batch is None:
+        batch = batches[channel.id] = []
+    batch.append(embed)
+    if len(batch) >= MAX_EMBEDS_PER_MESSAGE:
+        flush_batch(channel)
+    elif channel.id not in batch_timers:
+        batch_timers[channel.id] = asyncio.get_running_loop().call_later(EMBED_BATCH_WINDOW, flush_batch, channel)
+
+# Function to get the number of pending messages per channel
+def lane_depths():
+    return {channel_id: lane.qsize() for channel_id, lane in lanes.items()}
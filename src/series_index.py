@@ -0,0 +1,97 @@
+import json
+import time
+
+from config import SERIES_INDEX_SIZE, SERIES_POSTER_TTL, SONARR_SERIES_EXPORT
+
+from .cache import TTLCache
+from .tmdb import find_tvdb_show, get_poster_path
+from .custom_logger import logger
+
+"""
+Index of the Sonarr series: TVDB id -> TMDB id and poster url.
+
+The mapping of a series never changes, so it is looked up on TMDB once, on the
+first event of the series, and kept in src/json/series_index.json without an
+expiry. Posters do change, so the poster is looked up again when it is missing
+or older than SERIES_POSTER_TTL. Otherwise an event of a known series only costs
+a local lookup.
+
+The index can be seeded from a Sonarr series export (the JSON of
+GET /api/v3/series) by setting SONARR_SERIES_EXPORT. The export contains the
+TMDB id and the poster of every series, so seeded series need no TMDB call.
+"""
+
+TMDB_POSTER_URL = 'https://image.tmdb.org/t/p/w500'
+
+# TVDB id -> {'tmdb_id', 'poster_url', 'resolved_at' (unix time the poster was looked up)}
+series_index = TTLCache(SERIES_INDEX_SIZE, filename='series_index.json')
+series_index.load()
+
+def sonarr_poster_url(series):
+    for image in series.get('images') or []:
+        if image.get('coverType') == 'poster' and image.get('remoteUrl'):
+            return image['remoteUrl']
+    return None
+
+# Function to add the series of a Sonarr export to the index
+def seed_series_index(series_list):
+    seeded = 0
+    for series in series_list:
+        tvdb_id = series.get('tvdbId')
+        if not tvdb_id:
+            continue
+        entry = series_index.get(tvdb_id) or {}
+        poster_url = sonarr_poster_url(series)
+        series_index.set(tvdb_id, {
+            'tmdb_id': entry.get('tmdb_id') or series.get('tmdbId') or None,
+            # The poster of the export is current, without one the known poster is kept until it expires
+            'poster_url': poster_url or entry.get('poster_url'),
+            'resolved_at': time.time() if poster_url else entry.get('resolved_at', 0)
+        })
+        seeded += 1
+    series_index.save()
+    return seeded
+
+def load_sonarr_export(path):
+    try:
+        with open(path, 'r') as f:
+            series_list = json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"Sonarr series export {path} not found. Skipping seeding.")
+        return
+    except ValueError as e:
+        logger.error(f"Could not parse Sonarr series export {path}: {e}")
+        return
+    logger.info(f"Seeded the series index with {seed_series_index(series_list)} series from {path}")
+
+if SONARR_SERIES_EXPORT:
+    load_sonarr_export(SONARR_SERIES_EXPORT)
+
+# Function to look up a series on TMDB, returns the index entry or None if TMDB doesn't know it (yet)
+async def index_series(tvdb_id, entry):
+    if entry and entry.get('tmdb_id'):
+        poster_path = await get_poster_path('tv', entry['tmdb_id'])
+        tmdb_id = entry['tmdb_id']
+    else:
+        show = await find_tvdb_show(tvdb_id)
+        if show is None:
+            return entry
+        tmdb_id, poster_path = show['id'], show['poster_path']
+    indexed = {
+        'tmdb_id': tmdb_id,
+        # A poster that can't be found (anymore) doesn't replace the known one
+        'poster_url': f"{TMDB_POSTER_URL}{poster_path}" if poster_path else (entry or {}).get('poster_url'),
+        'resolved_at': time.time()
+    }
+    series_index.set(tvdb_id, indexed)
+    series_index.save_later()
+    return indexed
+
+# Function to get the poster url of a series by its TVDB id
+async def get_series_poster_url(tvdb_id):
+    if tvdb_id is None:
+        return None
+    entry = series_index.get(tvdb_id)
+    if entry is None or not entry['poster_url'] or time.time() - entry.get('resolved_at', 0) > SERIES_POSTER_TTL:
+        entry = await index_series(tvdb_id, entry)
+    return entry['poster_url'] if entry else None
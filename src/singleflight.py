@@ -0,0 +1,33 @@
+import asyncio
+
+"""
+Single-flight request coalescing.
+
+Concurrent calls with the same key share one in-flight call: the first caller
+starts it, later callers wait for the same future and every caller gets its
+result or exception. The key is forgotten as soon as the call finishes, so no
+stale results are served, caching is left to the callers. The result object is
+shared between all callers, so it must not be mutated.
+"""
+
+class SingleFlight:
+
+    def __init__(self):
+        self.calls = {}
+
+    def __len__(self):
+        return len(self.calls)
+
+    # Function to run factory() for a key, or wait for the call that is already running for it
+    async def do(self, key, factory):
+        future = self.calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self.calls[key] = future
+            future.add_done_callback(lambda done: self.forget(key, done))
+        # Shielded, so a cancelled caller doesn't cancel the call for the other callers
+        return await asyncio.shield(future)
+
+    def forget(self, key, future):
+        if self.calls.get(key) is future:
+            del self.calls[key]
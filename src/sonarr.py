@@ -1,14 +1,14 @@
 import discord
 from discord.utils import utcnow
-import requests
 
 from src.globals import (
-    TMDB_API_KEY, 
     SONARR_ICON_URL, 
     DISCORD_THUMBNAIL
 )
 
-from .custom_logger import logger
+from .series_index import get_series_poster_url
+
+MAX_SUMMARY_RELEASES = 21
 
 def convert_bytes_to_human_readable(size_in_bytes):
     if size_in_bytes < 1024 ** 3:  # Less than 1 GB
@@ -18,36 +18,19 @@ def convert_bytes_to_human_readable(size_in_bytes):
         result = size_in_bytes / (1024 ** 3)
         return "{:.2f}GB".format(result)
 
-def get_tmdb_poster_path(tvdb_id):
-    tmdb_api_key = TMDB_API_KEY
-    tmdb_url = f"https://api.themoviedb.org/3/find/{tvdb_id}?api_key={tmdb_api_key}&language=en-US&external_source=tvdb_id"
-    try:
-        response = requests.get(tmdb_url)
-        response.raise_for_status()
-        tmdb_data = response.json()
-        result = tmdb_data.get("tv_results", [])
-        if result:
-            poster_path = result[0].get("poster_path")
-            return poster_path
-        else:
-            return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching data from TMDB: {str(e)}")
-        return None
-
-def create_sonarr_embed(json_data):
-    event_type = json_data.get('eventType', 'N/A')
-    instance_name = json_data.get('instanceName', 'N/A')
+async def create_sonarr_embed(payload):
+    event_type = payload.event_type
+    instance_name = payload.instance_name
     embed_data = {}
 
     if event_type == "Test":
         embed_data = create_test_event_embed(instance_name)
     elif event_type == "Grab":
-        embed_data = create_grab_event_embed(json_data, instance_name)
+        embed_data = await create_grab_event_embed(payload, instance_name)
     elif event_type == "EpisodeFileDelete":
-        embed_data = create_episode_delete_event_embed(json_data, instance_name)
+        embed_data = await create_episode_delete_event_embed(payload, instance_name)
     elif event_type == "ApplicationUpdate":
-        embed_data = create_update_event_embed(json_data, instance_name)
+        embed_data = create_update_event_embed(payload, instance_name)
     else:
         embed_data = create_unknown_event_embed(event_type)
 
@@ -65,41 +48,39 @@ def create_test_event_embed(instance_name):
     embed.set_image(url=DISCORD_THUMBNAIL)
     return embed.to_dict()
 
-def create_grab_event_embed(json_data, instance_name):
-    series_title = json_data['series'].get('title', 'N/A')
-    release_data = json_data.get('release', {})
-    release_quality = release_data.get('quality', 'N/A')
-    release_size_bytes = release_data.get('size', 'N/A')
-    release_size_human_readable = convert_bytes_to_human_readable(release_size_bytes)
-    release_title = release_data.get('releaseTitle', 'N/A')
-    release_indexer = release_data.get('indexer', 'N/A')
-    indexer_value = format_indexer_value(release_indexer)
-    custom_format_score = release_data.get('customFormatScore', 'N/A')
-    custom_formats = release_data.get('customFormats', [])
-    tvdb_id = json_data['series'].get('tvdbId', 'N/A')
-    poster_path = get_tmdb_poster_path(tvdb_id)
-
-    if len(json_data['episodes']) > 1:
+async def create_grab_event_embed(payload, instance_name):
+    series_title = payload.series.title
+    release_data = payload.release
+    release_quality = release_data.quality
+    release_size_human_readable = convert_bytes_to_human_readable(release_data.size)
+    release_title = release_data.release_title
+    indexer_value = format_indexer_value(release_data.indexer)
+    custom_format_score = release_data.custom_format_score
+    custom_formats = release_data.custom_formats
+    poster_url = await get_series_poster_url(payload.series.tvdb_id)
+
+    episodes = payload.episodes
+    if len(episodes) > 1:
         # This is a season request
-        season_number = json_data['episodes'][0].get('seasonNumber', 'N/A')
+        season_number = episodes[0].season_number
         formatted_season_number = f"{season_number:02d}"
         embed_title = f"{series_title} (Season {formatted_season_number})"
         embed = discord.Embed(title=embed_title, color=0x67B7D1)
-        episode_count = len(json_data['episodes'])
+        episode_count = len(episodes)
         embed.add_field(name="Episodes", value=episode_count, inline=False)
     else:
         # This is an episode request
-        episode_title = json_data['episodes'][0].get('title', 'N/A')
-        episode_number = json_data['episodes'][0].get('episodeNumber', 'N/A')
-        season_number = json_data['episodes'][0].get('seasonNumber', 'N/A')
+        episode_title = episodes[0].title
+        episode_number = episodes[0].episode_number
+        season_number = episodes[0].season_number
         formatted_episode_number = f"{episode_number:02d}"
         formatted_season_number = f"{season_number:02d}"
         embed_title = f"{series_title} (S{formatted_season_number}E{formatted_episode_number})"
         embed = discord.Embed(title=embed_title, color=0x67B7D1)
         embed.add_field(name="Episode", value=episode_title, inline=False)
 
-    if poster_path:
-        embed.set_thumbnail(url=f"https://image.tmdb.org/t/p/w500{poster_path}")
+    if poster_url:
+        embed.set_thumbnail(url=poster_url)
     embed.set_author(name=f"{instance_name} - Grab", icon_url=SONARR_ICON_URL)
     embed.add_field(name="Size", value=release_size_human_readable, inline=True)
     embed.add_field(name="Quality", value=release_quality, inline=True)
@@ -114,24 +95,56 @@ def create_grab_event_embed(json_data, instance_name):
     embed.set_image(url=DISCORD_THUMBNAIL)
     return embed.to_dict()
 
-def create_episode_delete_event_embed(json_data, instance_name):
-    series_title = json_data['series'].get('title', 'N/A')
-    episode_number = json_data['episodes'][0].get('episodeNumber', 'N/A')
-    season_number = json_data['episodes'][0].get('seasonNumber', 'N/A')
-    episode_data = json_data.get('episodeFile', {})
-    episode_path = episode_data.get('path', 'N/A')
-    episode_size_bytes = episode_data.get('size', 'N/A')
-    episode_size_human_readable = convert_bytes_to_human_readable(episode_size_bytes)
-    tvdb_id = json_data['series'].get('tvdbId', 'N/A')
-    poster_path = get_tmdb_poster_path(tvdb_id)
+# Consolidated embed for several grabs of the same series and season
+async def create_grab_summary_embed(grabs):
+    payload = grabs[0]
+    instance_name = payload.instance_name
+    series_title = payload.series.title
+    season_number = payload.episodes[0].season_number
+    poster_url = await get_series_poster_url(payload.series.tvdb_id)
+
+    formatted_season_number = f"{season_number:02d}"
+    embed = discord.Embed(title=f"{series_title} (Season {formatted_season_number})", color=0x67B7D1)
+    episode_count = sum(len(grab.episodes) for grab in grabs)
+    total_size = sum(grab.release.size for grab in grabs)
+    embed.add_field(name="Episodes", value=episode_count, inline=True)
+    embed.add_field(name="Releases", value=len(grabs), inline=True)
+    embed.add_field(name="Total Size", value=convert_bytes_to_human_readable(total_size), inline=True)
+
+    # Discord allows 25 fields per embed, 3 are used above and 1 is kept for the overflow line
+    sorted_grabs = sorted(grabs, key=lambda grab: grab.episodes[0].episode_number)
+    for grab in sorted_grabs[:MAX_SUMMARY_RELEASES]:
+        episodes = grab.episodes
+        episode_numbers = ", ".join(f"E{episode.episode_number:02d}" for episode in episodes)
+        field_name = f"{episode_numbers} - {episodes[0].title}" if len(episodes) == 1 else episode_numbers
+        release_size_human_readable = convert_bytes_to_human_readable(grab.release.size)
+        embed.add_field(name=field_name, value=f"{release_size_human_readable} • {grab.release.quality}", inline=False)
+    if len(sorted_grabs) > MAX_SUMMARY_RELEASES:
+        embed.add_field(name="More", value=f"...and {len(sorted_grabs) - MAX_SUMMARY_RELEASES} more releases", inline=False)
+
+    if poster_url:
+        embed.set_thumbnail(url=poster_url)
+    embed.set_author(name=f"{instance_name} - Grab", icon_url=SONARR_ICON_URL)
+    timestamp = utcnow()
+    embed.timestamp = timestamp
+    embed.set_image(url=DISCORD_THUMBNAIL)
+    return embed.to_dict()
+
+async def create_episode_delete_event_embed(payload, instance_name):
+    series_title = payload.series.title
+    episode_number = payload.episodes[0].episode_number
+    season_number = payload.episodes[0].season_number
+    episode_path = payload.episode_file.path
+    episode_size_human_readable = convert_bytes_to_human_readable(payload.episode_file.size)
+    poster_url = await get_series_poster_url(payload.series.tvdb_id)
     formatted_episode_number = f"{episode_number:02d}"
     formatted_season_number = f"{season_number:02d}"
     embed = discord.Embed(
         title=f"{series_title} (S{formatted_season_number}E{formatted_episode_number})",
         color=0xFF0000
     )
-    if poster_path:
-        embed.set_thumbnail(url=f"https://image.tmdb.org/t/p/w500{poster_path}")
+    if poster_url:
+        embed.set_thumbnail(url=poster_url)
     embed.set_author(name=f"{instance_name} - Episode Deleted", icon_url=SONARR_ICON_URL)
     embed.add_field(name="Size", value=episode_size_human_readable, inline=False)
     embed.add_field(name="Path", value=episode_path, inline=False)
@@ -140,9 +153,9 @@ def create_episode_delete_event_embed(json_data, instance_name):
     embed.set_image(url=DISCORD_THUMBNAIL)
     return embed.to_dict()
 
-def create_update_event_embed(json_data, instance_name):
-    old_version = json_data.get('previousVersion', 'N/A')
-    new_version = json_data.get('newVersion', 'N/A')
+def create_update_event_embed(payload, instance_name):
+    old_version = payload.previous_version
+    new_version = payload.new_version
     embed = discord.Embed(
         color=0x00ff00
     )
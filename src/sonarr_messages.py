@@ -0,0 +1,105 @@
+import asyncio
+import discord
+
+from config import SONARR_MESSAGE_CACHE_SIZE, SONARR_MESSAGE_IDLE_TIMEOUT, SONARR_GRAB_WINDOW
+
+from .cache import TTLCache
+from .sonarr import create_sonarr_embed, create_grab_summary_embed
+from .send_scheduler import send, edit, MAX_EMBED_CHARACTERS
+from .custom_logger import logger
+
+"""
+Grouping of Sonarr grab and delete embeds per series and season.
+
+Every (series, season) key remembers the message it was posted in together with
+the embeds of that message, so a new event is appended with a single edit call
+instead of fetching the message first. The cache survives restarts.
+
+Grabs are collected per key for SONARR_GRAB_WINDOW seconds, so a season that is
+grabbed episode by episode results in one consolidated embed and a single send
+or edit instead of one edit per episode.
+"""
+
+MAX_EMBEDS_PER_MESSAGE = 10
+
+# (series title, season number) -> {'channel_id', 'message_id', 'embeds'}
+grouped_messages = TTLCache(SONARR_MESSAGE_CACHE_SIZE, ttl=SONARR_MESSAGE_IDLE_TIMEOUT, filename='sonarr_messages.json')
+grouped_messages.load()
+
+# (series title, season number) -> [lock, number of deliveries using it], keeps concurrent workers
+# from sending duplicate messages for a key without making other keys wait
+key_locks = {}
+
+# (series title, season number) -> Sonarr grab payloads waiting for the window to close
+pending_grabs = {}
+
+# Tasks waiting for a grab window to close, referenced so they aren't garbage collected
+flush_tasks = set()
+
+# Function to send a new grouped message and remember it for its key
+async def send_grouped_message(channel, key, embed_data):
+    message = await send(channel, embed=discord.Embed.from_dict(embed_data))
+    grouped_messages.set(key, {
+        'channel_id': channel.id,
+        'message_id': message.id,
+        'embeds': [embed_data]
+    })
+
+# Function to add a Sonarr embed to the message of its series and season, or start a new one
+async def deliver_grouped_embed(channel, key, embed_data):
+    key_lock = key_locks.setdefault(key, [asyncio.Lock(), 0])
+    key_lock[1] += 1
+    try:
+        async with key_lock[0]:
+            await update_grouped_message(channel, key, embed_data)
+    finally:
+        key_lock[1] -= 1
+        if key_lock[1] == 0:
+            del key_locks[key]
+
+async def update_grouped_message(channel, key, embed_data):
+    entry = grouped_messages.get(key)
+    if entry is None or entry['channel_id'] != channel.id or len(entry['embeds']) >= MAX_EMBEDS_PER_MESSAGE:
+        await send_grouped_message(channel, key, embed_data)
+    else:
+        embeds = [discord.Embed.from_dict(embed) for embed in entry['embeds'] + [embed_data]]
+        if sum(len(embed) for embed in embeds) > MAX_EMBED_CHARACTERS:
+            # Discord rejects messages with more than 6000 characters of embeds
+            await send_grouped_message(channel, key, embed_data)
+        else:
+            # A partial message can be edited without fetching it first
+            message = channel.get_partial_message(entry['message_id'])
+            try:
+                await edit(channel, message, embeds=embeds)
+                grouped_messages.set(key, {**entry, 'embeds': entry['embeds'] + [embed_data]})
+            except discord.NotFound:
+                logger.info(f"Grouped message for {key} no longer exists, sending a new one")
+                await send_grouped_message(channel, key, embed_data)
+            except discord.HTTPException as e:
+                logger.warning(f"Could not edit the grouped message for {key} ({e}), sending a new one")
+                await send_grouped_message(channel, key, embed_data)
+    grouped_messages.save_later()
+
+# Function to build and deliver the embed for the grabs collected during the window of a key
+async def flush_grabs(channel, key):
+    await asyncio.sleep(SONARR_GRAB_WINDOW)
+    grabs = pending_grabs.pop(key)
+    try:
+        if len(grabs) == 1:
+            embed_data = await create_sonarr_embed(grabs[0])
+        else:
+            embed_data = await create_grab_summary_embed(grabs)
+            logger.info(f"Consolidated {len(grabs)} Sonarr grabs for {key[0]} season {key[1]}")
+        await deliver_grouped_embed(channel, key, embed_data)
+    except Exception as e:
+        logger.error(f"Error delivering Sonarr grabs for {key}: {e}")
+
+# Function to collect a Sonarr grab, the first grab of a key opens its window
+def queue_grab(channel, key, data):
+    if key in pending_grabs:
+        pending_grabs[key].append(data)
+    else:
+        pending_grabs[key] = [data]
+        task = asyncio.create_task(flush_grabs(channel, key))
+        flush_tasks.add(task)
+        task.add_done_callback(flush_tasks.discard)
@@ -1,4 +1,3 @@
-import requests
 import discord
 
 from src.globals import (
@@ -7,24 +6,24 @@ from src.globals import (
 )
 
 from .custom_logger import logger
+from .http_client import get_json, RequestError
 
 previous_activity = None
 
-def fetch_tautulli_activity():
+async def fetch_tautulli_activity():
     try:
-        response = requests.get(
+        data = await get_json(
+            'tautulli',
             f'{TAUTULLI_API_URL}/api/v2',
             params={
                 'apikey': TAUTULLI_API_KEY,
                 'cmd': 'get_activity'
             }
         )
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('response', {}).get('data', {})
-        else:
-            logger.error(f"Failed to fetch Tautulli data. Status code: {response.status_code}")
-            return {}
+        return data.get('response', {}).get('data', {})
+    except RequestError as e:
+        logger.error(f"Failed to fetch Tautulli data: {e}")
+        return {}
     except Exception as e:
         logger.error(f"An error occurred while fetching Tautulli data: {e}")
         return {}
@@ -32,7 +31,7 @@ def fetch_tautulli_activity():
 async def tautulli_discord_presence(bot):
     global previous_activity
     try:
-        tautulli_data = fetch_tautulli_activity()
+        tautulli_data = await fetch_tautulli_activity()
         if tautulli_data:
             stream_count = int(tautulli_data.get('stream_count', 0))
             sessions = tautulli_data.get('sessions', [])
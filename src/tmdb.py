@@ -0,0 +1,86 @@
+import aiohttp
+
+from config import TMDB_CACHE_SIZE, TMDB_CACHE_TTL
+
+from .globals import TMDB_API_KEY, TMDB_API_URL
+from .cache import TTLCache, MISSING
+from .http_client import get_json, RequestError
+from .singleflight import SingleFlight
+from .custom_logger import logger
+
+"""
+Shared TMDB client for the Sonarr, Radarr and Trakt embeds.
+
+Every lookup is cached per (endpoint, id) in a TTL cache that is persisted to
+src/json/tmdb_cache.json, so repeated grabs, ratings and weekly reports for the
+same titles don't call TMDB again, also not after a restart. Only the fields
+the embeds use are cached, and ids TMDB doesn't know are cached as None.
+"""
+
+tmdb_cache = TTLCache(TMDB_CACHE_SIZE, ttl=TMDB_CACHE_TTL, filename='tmdb_cache.json')
+tmdb_cache.load()
+
+lookups = SingleFlight()
+
+def trim_details(data):
+    details = {'poster_path': data.get('poster_path')}
+    if 'seasons' in data:
+        details['seasons'] = [
+            {'season_number': season.get('season_number'), 'poster_path': season.get('poster_path')}
+            for season in data['seasons']
+        ]
+    return details
+
+def trim_episode(data):
+    return {'still_path': data.get('still_path')}
+
+def first_show(data):
+    results = data.get('tv_results', [])
+    return {'id': results[0].get('id'), 'poster_path': results[0].get('poster_path')} if results else None
+
+# Function to get a TMDB endpoint through the cache, returns None if the lookup failed
+async def fetch(key, path, trim, params=None):
+    cached = tmdb_cache.get(key, MISSING)
+    if cached is not MISSING:
+        return cached
+    # Concurrent misses for the same key share one lookup and cache update
+    return await lookups.do(key, lambda: lookup(key, path, trim, params))
+
+async def lookup(key, path, trim, params):
+    params = {'api_key': TMDB_API_KEY or '', 'language': 'en-US', **(params or {})}
+    try:
+        value = trim(await get_json('tmdb', f'{TMDB_API_URL}/{path}', params=params))
+    except aiohttp.ClientResponseError as e:
+        if e.status != 404:
+            logger.error(f"Failed to fetch TMDB {path}: {e}")
+            return None
+        # Unknown ids are cached too, so they don't cost a request every time
+        value = None
+    except RequestError as e:
+        logger.error(f"Failed to fetch TMDB {path}: {e}")
+        return None
+    tmdb_cache.set(key, value)
+    tmdb_cache.save_later()
+    return value
+
+# Function to get the details ('poster_path' and for shows 'seasons') of a movie or tv show
+async def get_details(media_type, tmdb_id):
+    if tmdb_id is None:
+        return None
+    return await fetch((media_type, tmdb_id), f'{media_type}/{tmdb_id}', trim_details)
+
+async def get_episode_details(tmdb_id, season_number, episode_number):
+    if tmdb_id is None:
+        return None
+    path = f'tv/{tmdb_id}/season/{season_number}/episode/{episode_number}'
+    return await fetch(('episode', tmdb_id, season_number, episode_number), path, trim_episode)
+
+async def get_poster_path(media_type, tmdb_id):
+    details = await get_details(media_type, tmdb_id)
+    return details['poster_path'] if details else None
+
+# Function to find a tv show ('id' and 'poster_path') by its TVDB id, as sent by Sonarr
+async def find_tvdb_show(tvdb_id):
+    if tvdb_id is None:
+        return None
+    return await fetch(('find/tvdb', tvdb_id), f'find/{tvdb_id}', first_show, params={'external_source': 'tvdb_id'})
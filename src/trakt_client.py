@@ -0,0 +1,141 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import aiohttp
+
+from config import TRAKT_PREFETCH_PAGES
+
+from .globals import TRAKT_CLIENT_ID, TRAKT_ACCESS_TOKEN
+from .http_client import get_response
+from .custom_logger import logger
+
+"""
+Trakt API client shared by the ratings, favorites, comments, history and
+weekly report modules.
+
+Every response's X-Ratelimit header is read. When the remaining requests of the
+window run low, the following requests are spread over the rest of the window
+instead of running into it. A 429 is retried after its Retry-After, or with an
+exponential backoff when there is none. The pause applies to every Trakt
+request, not just the one that was throttled.
+
+paginate() streams a paginated endpoint page by page. Once the first page has
+told the page count (X-Pagination-Page-Count), up to TRAKT_PREFETCH_PAGES of the
+next pages are requested concurrently while the caller handles the current one.
+"""
+
+PAGE_LIMIT = 100
+MAX_RETRIES = 4
+BACKOFF_BASE = 2  # Seconds before the first retry of a 429 without Retry-After, doubled per retry
+BACKOFF_MAX = 60
+RATE_LIMIT_RESERVE = 20  # Below this many remaining requests the rest of the window is paced
+
+# Trakt timestamps look like 2024-03-01T20:15:00.000Z, they sort chronologically as text
+TRAKT_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
+
+# Monotonic time before which no request is sent
+throttle = {'resume_at': 0.0}
+
+def trakt_time(moment):
+    return moment.strftime(TRAKT_TIME_FORMAT)
+
+def trakt_headers(authorized=False):
+    headers = {
+        'Content-Type': 'application/json',
+        'trakt-api-version': '2',
+        'trakt-api-key': TRAKT_CLIENT_ID
+    }
+    if authorized:
+        headers['Authorization'] = f'Bearer {TRAKT_ACCESS_TOKEN}'
+    return headers
+
+def pause(seconds):
+    throttle['resume_at'] = max(throttle['resume_at'], time.monotonic() + seconds)
+
+async def wait_for_rate_limit():
+    delay = throttle['resume_at'] - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+# Function to pace the next requests by the X-Ratelimit header, e.g.
+# {"name": "UNAUTHED_API_GET_LIMIT", "period": 300, "limit": 1000, "remaining": 999, "until": "2024-03-01T20:15:00Z"}
+def observe_rate_limit(headers):
+    try:
+        rate_limit = json.loads(headers['X-Ratelimit'])
+        remaining = int(rate_limit['remaining'])
+        until = datetime.strptime(rate_limit['until'], '%Y-%m-%dT%H:%M:%SZ')
+    except (KeyError, TypeError, ValueError):
+        return
+    if remaining >= RATE_LIMIT_RESERVE:
+        return
+    window_left = max((until - datetime.utcnow()).total_seconds(), 0)
+    # The remaining requests are spread evenly, none left means waiting for the next window
+    pause(window_left / max(remaining, 1) if remaining else window_left)
+
+def retry_delay(headers, attempt):
+    try:
+        return float(headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+
+# Function to GET a Trakt url, returns the status, headers and JSON body (None for 304), raises RequestError on failure
+async def request(url, params=None, headers=None):
+    headers = headers or trakt_headers()
+    for attempt in range(MAX_RETRIES + 1):
+        await wait_for_rate_limit()
+        try:
+            status, response_headers, data = await get_response('trakt', url, params=params, headers=headers)
+        except aiohttp.ClientResponseError as e:
+            if e.status != 429 or attempt == MAX_RETRIES:
+                raise
+            delay = retry_delay(e.headers or {}, attempt)
+            logger.warning(f'Trakt rate limit reached, retrying {url} in {delay:.0f} seconds')
+            pause(delay)
+            continue
+        observe_rate_limit(response_headers)
+        return status, response_headers, data
+
+# Function to GET a Trakt url and decode the JSON body, raises RequestError on failure
+async def get(url, params=None, headers=None):
+    status, response_headers, data = await request(url, params=params, headers=headers)
+    return data
+
+# Function to stream the pages of a Trakt url as (status, headers, data), raises RequestError if a page failed
+async def paginate(url, params=None, headers=None, first_headers=None, prefetch=TRAKT_PREFETCH_PAGES, limit=PAGE_LIMIT):
+    """
+    first_headers replaces headers for the first page, e.g. to make it
+    conditional. A 304 on the first page is yielded and ends the stream.
+    prefetch=0 requests the pages one by one, for callers that usually stop
+    after the first page.
+    """
+    def page_params(page):
+        return {**(params or {}), 'page': page, 'limit': limit}
+
+    status, response_headers, data = await request(url, page_params(1), first_headers or headers)
+    yield status, response_headers, data
+    if status == 304:
+        return
+    page_count = response_headers.get('X-Pagination-Page-Count')
+    if page_count is None:
+        # Without pagination headers a full page is the only hint that there is more
+        page = 1
+        while len(data) >= limit:
+            page += 1
+            status, response_headers, data = await request(url, page_params(page), headers)
+            yield status, response_headers, data
+        return
+    page_count = int(page_count)
+    tasks = {}
+    try:
+        for page in range(2, page_count + 1):
+            # Keep the current page and up to prefetch pages after it in flight
+            for ahead in range(page, min(page + prefetch, page_count) + 1):
+                if ahead not in tasks:
+                    tasks[ahead] = asyncio.ensure_future(request(url, page_params(ahead), headers))
+            yield await tasks.pop(page)
+    finally:
+        # The caller stopped early or a page failed, the prefetched pages aren't needed
+        for task in tasks.values():
+            task.cancel()
@@ -0,0 +1,61 @@
+from .globals import TRAKT_USERNAME
+from .http_client import RequestError
+from .trakt_client import paginate
+from .trakt_poller import get_activity_stamp
+from .custom_logger import logger
+
+"""
+Index of the Trakt comments of TRAKT_USERNAME, keyed by (type, trakt id).
+
+The comments are downloaded once per ratings cycle, page by page, instead of
+once per rating. When TRAKT_ACCESS_TOKEN is set, /sync/last_activities (which
+needs OAuth) is checked first and the comments are only downloaded again when
+one of the commented_at timestamps changed. The last activities are shared with
+the ratings poll (see trakt_poller), so an unchanged cycle costs no extra request.
+"""
+
+COMMENTS_URL = f'https://api.trakt.tv/users/{TRAKT_USERNAME}/comments'
+
+# Timestamps of the last activities that change when a comment is posted
+COMMENT_ACTIVITY = [(comment_type, 'commented_at') for comment_type in ['movies', 'shows', 'seasons', 'episodes']]
+
+# (type, trakt id) -> comment
+comment_index = {}
+
+# The commented_at timestamps the index was built at, None if the index wasn't built or they are unknown
+index_state = {'built': False, 'activity': None}
+
+# Function to download all comments of the user, returns None if a page failed
+async def fetch_all_comments():
+    comments = []
+    try:
+        async for status, headers, page_comments in paginate(COMMENTS_URL):
+            comments.extend(page_comments)
+    except RequestError as e:
+        logger.error(f'Request to {COMMENTS_URL} failed: {e}')
+        return None
+    return comments
+
+# Function to bring the comment index up to date, called once at the start of a ratings cycle
+async def refresh_comment_index():
+    activity = await get_activity_stamp(COMMENT_ACTIVITY)
+    if index_state['built'] and activity is not None and activity == index_state['activity']:
+        logger.debug('Trakt comments unchanged, keeping the comment index')
+        return
+    comments = await fetch_all_comments()
+    if comments is None:
+        # Keep the previous index, the next cycle tries again
+        return
+    comment_index.clear()
+    for comment in comments:
+        content_type = comment['type']
+        content = comment.get(content_type)
+        # Comments are sorted newest first, the newest comment of an item wins
+        if content and (content_type, content['ids']['trakt']) not in comment_index:
+            comment_index[(content_type, content['ids']['trakt'])] = comment['comment']
+    index_state['built'] = True
+    index_state['activity'] = activity
+    logger.debug(f'Indexed {len(comment_index)} Trakt comments')
+
+def get_user_comment(content_type, trakt_id):
+    return comment_index.get((content_type, trakt_id))
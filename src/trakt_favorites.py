@@ -1,23 +1,29 @@
 from calendar import weekday
-import requests
 import json
 import os
 from datetime import datetime, timedelta
 
 from src.globals import (
-    TRAKT_CLIENT_ID, 
-    TMDB_API_KEY, 
     TRAKT_USERNAME, 
     TRAKT_URL_FAVORITES, 
-    TMDB_API_KEY, 
     TRAKT_ICON_URL, 
     DISCORD_THUMBNAIL
 )
 
 from .custom_logger import logger
+from .http_client import RequestError
+from .trakt_client import trakt_time
+from .trakt_poller import stream_new, mark_processed
+from .tmdb import get_details
 
 processed_favorite_embeds = set()
 
+# Favorites of this period are posted on the first run, later runs continue at the watermark
+INITIAL_FAVORITE_WINDOW = timedelta(hours=24)
+
+# Timestamps of the last activities that change when something is favorited
+FAVORITE_ACTIVITY = [(favorite_type, 'favorited_at') for favorite_type in ['movies', 'shows']]
+
 def load_favorite_processed_embeds():
     file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'json', 'processed_favorite_embeds.json')
     try:
@@ -33,10 +39,10 @@ def save_favorite_processed_embeds():
         json.dump(list(processed_favorite_embeds), f)
     logger.info(f"Successfully saved data to {file_path}")
 
-def format_favorite_show_embed(show):
+async def format_favorite_show_embed(show):
     trakt_link = f'[Trakt](https://trakt.tv/shows/{show["show"]["ids"]["trakt"]})'
     imdb_link = f'[IMDb](https://www.imdb.com/title/{show["show"]["ids"]["imdb"]})'
-    tmdb_details = get_tmdb_details('tv', show["show"]["ids"]["tmdb"])
+    tmdb_details = await get_details('tv', show["show"]["ids"]["tmdb"])
     if tmdb_details:
         thumbnail = f'https://image.tmdb.org/t/p/w500/{tmdb_details["poster_path"]}'
     else:
@@ -62,10 +68,10 @@ def format_favorite_show_embed(show):
         }
     }
 
-def format_favorite_movie_embed(movie):
+async def format_favorite_movie_embed(movie):
     trakt_link = f'[Trakt](https://trakt.tv/movies/{movie["movie"]["ids"]["trakt"]})'
     imdb_link = f'[IMDb](https://www.imdb.com/title/{movie["movie"]["ids"]["imdb"]})'
-    tmdb_details = get_tmdb_details('movie', movie["movie"]["ids"]["tmdb"])
+    tmdb_details = await get_details('movie', movie["movie"]["ids"]["tmdb"])
     if tmdb_details:
         thumbnail = f'https://image.tmdb.org/t/p/w500/{tmdb_details["poster_path"]}'
     else:
@@ -91,92 +97,63 @@ def format_favorite_movie_embed(movie):
         }
     }
 
+# Function to stream the favorites newer than the watermark
 def fetch_trakt_favorites():
-    headers = {
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': TRAKT_CLIENT_ID
-    }
-    try:
-        response = requests.get(TRAKT_URL_FAVORITES, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.info(f'Failed to fetch Trakt favorites: {str(e)}')
-        return []
-
-def get_tmdb_details(media_type, tmdb_id):
-    url = f'https://api.themoviedb.org/3/{media_type}/{tmdb_id}?api_key={TMDB_API_KEY}'
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.info(f'Failed to fetch TMDB details: {str(e)}')
-        return None
-
-def get_tmdb_season_details(tmdb_id, season_number):
-    url = f'https://api.themoviedb.org/3/tv/{tmdb_id}/season/{season_number}?api_key={TMDB_API_KEY}'
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.info(f'Failed to fetch TMDB season details: {str(e)}')
-        return None
-
-def get_tmdb_episode_details(tmdb_id, season_number, episode_number):
-    url = f'https://api.themoviedb.org/3/tv/{tmdb_id}/season/{season_number}/episode/{episode_number}?api_key={TMDB_API_KEY}'
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.info(f'Failed to fetch TMDB episode details: {str(e)}')
-        return None
-
-def process_favorites(favorites):
-    current_time = datetime.utcnow()
-    time_limit = current_time - timedelta(hours=24)
-    sorted_favorites = sorted(favorites, key=lambda x: x['listed_at'])
+    # The first run starts at the last day, not at the first favorite ever
+    initial = trakt_time(datetime.utcnow() - INITIAL_FAVORITE_WINDOW)
+    # Favorites are sorted by rank, not by date, so every page is read and filtered by the watermark
+    return stream_new('favorites', TRAKT_URL_FAVORITES, FAVORITE_ACTIVITY, 'listed_at', initial, newest_first=False)
 
+async def process_favorites(favorites):
     # Check if there are any new favorites
-    new_favorites = [favorite for favorite in reversed(sorted_favorites) if datetime.strptime(favorite['listed_at'], '%Y-%m-%dT%H:%M:%S.%fZ') >= time_limit]
+    new_favorites = sorted([favorite async for favorite in favorites], key=lambda x: x['listed_at'], reverse=True)
     if not new_favorites:
+        mark_processed('favorites')
         return None  # No new favorites, so return None
 
     # There are new favorites, so load the processed embeds
     load_favorite_processed_embeds()
 
     embeds = []
+    ids = []
     for favorite in new_favorites:
-        if len(embeds) >= 10:
-            break
         if favorite['type'] == 'show':
             if favorite['show']['ids']['trakt'] not in processed_favorite_embeds:
-                embed = format_favorite_show_embed(favorite)
+                embed = await format_favorite_show_embed(favorite)
                 embeds.append(embed)
-                processed_favorite_embeds.add(favorite['show']['ids']['trakt'])
+                ids.append(favorite['show']['ids']['trakt'])
         elif favorite['type'] == 'movie':
             if favorite['movie']['ids']['trakt'] not in processed_favorite_embeds:
-                embed = format_favorite_movie_embed(favorite)
+                embed = await format_favorite_movie_embed(favorite)
                 embeds.append(embed)
-                processed_favorite_embeds.add(favorite['movie']['ids']['trakt'])
+                ids.append(favorite['movie']['ids']['trakt'])
+    newest = new_favorites[0]['listed_at']
     if embeds:
-        embeds = embeds[::-1]
+        # Nothing is remembered yet, mark_favorites_sent() is called once the embeds were sent
         data = {
-            'embeds': embeds
+            'embeds': embeds[::-1],
+            'ids': ids[::-1],
+            'newest': newest
         }
-        save_favorite_processed_embeds()
         return data
+    mark_processed('favorites', newest)
     return None
 
-def trakt_favorites():
+# Function to remember the favorites whose embeds were sent, newest moves the watermark once all of them were sent
+def mark_favorites_sent(ids, newest=None):
+    if ids:
+        processed_favorite_embeds.update(ids)
+        save_favorite_processed_embeds()
+    if newest is not None:
+        mark_processed('favorites', newest)
+
+async def trakt_favorites():
     try:
-        favorites = fetch_trakt_favorites()
-        result = process_favorites(favorites)
+        result = await process_favorites(fetch_trakt_favorites())
         if result:
             logger.info(f'Found {len(result["embeds"])} new favorites')
         return result
+    except RequestError as e:
+        logger.info(f'Failed to fetch Trakt favorites: {str(e)}')
     except Exception as e:
-        logger.error(f'Error occurred: {str(e)}')
\ No newline at end of file
+        logger.error(f'Error occurred: {str(e)}')
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+from config import TRAKT_HISTORY_BACKFILL_DAYS
+
+from .globals import TRAKT_USERNAME
+from .cache import data_path
+from .http_client import RequestError
+from .trakt_client import paginate, trakt_time
+from .custom_logger import logger
+
+"""
+Local store of the Trakt watch history of TRAKT_USERNAME.
+
+The history is kept in an SQLite database (src/json/trakt_history.db) indexed
+on watched_at. Every sync only downloads the plays since the newest play that
+is already stored (the watermark), so weekly, monthly or ad-hoc reports are
+answered with a local query instead of downloading the period again. The first
+sync downloads the last TRAKT_HISTORY_BACKFILL_DAYS days.
+
+Plays that are removed on Trakt after they were synced stay in the store.
+"""
+
+HISTORY_URL = f"https://api.trakt.tv/users/{TRAKT_USERNAME}/history"
+
+database = sqlite3.connect(data_path('trakt_history.db'))
+database.executescript('''
+    CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY,
+        watched_at TEXT NOT NULL,
+        type TEXT NOT NULL,
+        item TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS history_watched_at ON history (watched_at);
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+''')
+
+# Lock so the weekly report and a manual command never sync at the same time
+sync_lock = asyncio.Lock()
+
+def get_watermark():
+    row = database.execute("SELECT value FROM sync_state WHERE key = 'watermark'").fetchone()
+    return row[0] if row else None
+
+# Function to store a page of plays, returns the number of plays that were new
+def store_plays(plays):
+    with database:
+        inserted = database.executemany(
+            "INSERT OR IGNORE INTO history (id, watched_at, type, item) VALUES (?, ?, ?, ?)",
+            [(play['id'], play['watched_at'], play['type'], json.dumps(play)) for play in plays]
+        )
+    return inserted.rowcount
+
+def set_watermark(watermark):
+    with database:
+        database.execute(
+            "INSERT INTO sync_state (key, value) VALUES ('watermark', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (watermark,)
+        )
+
+# Function to download the plays since the watermark, returns the number of new plays
+async def sync_history():
+    async with sync_lock:
+        # The watermark itself is requested again, plays that are already stored are ignored by id
+        start_at = get_watermark() or trakt_time(datetime.utcnow() - timedelta(days=TRAKT_HISTORY_BACKFILL_DAYS))
+        new_plays = 0
+        newest = None
+        try:
+            async for status, headers, plays in paginate(HISTORY_URL, params={"start_at": start_at}):
+                new_plays += store_plays(plays)
+                newest = max(filter(None, [newest, *(play['watched_at'] for play in plays)]), default=None)
+        except RequestError as e:
+            # Trakt pages newest first, so the watermark stays put until every page is stored
+            logger.error(f"Failed to sync Trakt history, keeping the watermark at {start_at}: {e}")
+            return new_plays
+        if newest is not None:
+            set_watermark(newest)
+        logger.info(f"Synced Trakt history since {start_at}, {new_plays} new plays")
+        return new_plays
+
+# Function to get the stored plays watched between two datetimes (UTC), oldest first
+def history_between(start, end, play_type=None):
+    query = "SELECT item FROM history WHERE watched_at >= ? AND watched_at < ?"
+    params = [trakt_time(start), trakt_time(end)]
+    if play_type is not None:
+        query += " AND type = ?"
+        params.append(play_type)
+    query += " ORDER BY watched_at"
+    return [json.loads(item) for item, in database.execute(query, params)]
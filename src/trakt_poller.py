@@ -0,0 +1,160 @@
+import json
+import os
+import time
+
+from config import TRAKT_PREFETCH_PAGES
+
+from .globals import TRAKT_ACCESS_TOKEN
+from .http_client import RequestError
+from .trakt_client import request, paginate, trakt_headers
+from .cache import data_path
+from .custom_logger import logger
+
+"""
+Change detection for the Trakt polls of TRAKT_USERNAME.
+
+A poll only downloads a list when it changed since the previous poll:
+- With TRAKT_ACCESS_TOKEN, /sync/last_activities (which needs OAuth) is checked
+  first. It is one small response for all lists, and the list is skipped when
+  its rated_at / favorited_at timestamps are the same as at the previous poll.
+- The first page of a list sorted newest first is requested with the ETag and
+  Last-Modified of the previous response, Trakt answers 304 Not Modified
+  without a body when the list didn't change.
+When a list did change, its items are streamed newest first and the download
+stops at the watermark: the timestamp of the newest item that was processed,
+persisted per list in src/json/trakt_watermarks.json. A run therefore costs
+O(new items), however late it runs.
+"""
+
+LAST_ACTIVITIES_URL = 'https://api.trakt.tv/sync/last_activities'
+LAST_ACTIVITIES_MAX_AGE = 30  # Seconds the last activities are reused, so a cycle polling several lists asks once
+
+# url -> {'etag', 'last_modified'} of the previous processed download
+validators = {}
+
+# Name of the list -> activity timestamps at the previous processed download
+activity_seen = {}
+
+# Name of the list -> (url, validators, activity timestamps) of a download that wasn't processed yet
+pending = {}
+
+# Name of the list -> timestamp of the newest processed item
+watermarks = {}
+
+# The last activities and when they were fetched (monotonic time)
+last_activities = {'data': None, 'fetched_at': None}
+
+def load_watermarks():
+    file_path = data_path('trakt_watermarks.json')
+    try:
+        with open(file_path, 'r') as f:
+            watermarks.update(json.load(f))
+            logger.info(f"Successfully loaded data from {file_path}")
+    except FileNotFoundError:
+        logger.info(f"File {file_path} not found. Skipping loading.")
+
+def save_watermarks():
+    file_path = data_path('trakt_watermarks.json')
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(watermarks, f)
+    os.replace(temp_path, file_path)
+    logger.debug(f"Successfully saved data to {file_path}")
+
+load_watermarks()
+
+def conditional_headers(url, authorized=False):
+    headers = trakt_headers(authorized)
+    previous = validators.get(url, {})
+    if previous.get('etag'):
+        headers['If-None-Match'] = previous['etag']
+    if previous.get('last_modified'):
+        headers['If-Modified-Since'] = previous['last_modified']
+    return headers
+
+def remember_validators(url, headers):
+    validators[url] = {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+
+# Function to get the last activities of the user, returns None without access token or on failure
+async def get_last_activities():
+    if not TRAKT_ACCESS_TOKEN:
+        return None
+    fetched_at = last_activities['fetched_at']
+    if fetched_at is not None and time.monotonic() - fetched_at < LAST_ACTIVITIES_MAX_AGE:
+        return last_activities['data']
+    try:
+        status, headers, data = await request(
+            LAST_ACTIVITIES_URL, headers=conditional_headers(LAST_ACTIVITIES_URL, authorized=True)
+        )
+    except RequestError as e:
+        logger.error(f'Failed to fetch Trakt last activities: {e}')
+        return None
+    if status != 304:
+        last_activities['data'] = data
+        remember_validators(LAST_ACTIVITIES_URL, headers)
+    last_activities['fetched_at'] = time.monotonic()
+    return last_activities['data']
+
+# Function to get the timestamps of the given (type, field) pairs, returns None if they are unknown
+async def get_activity_stamp(fields):
+    activities = await get_last_activities()
+    if activities is None:
+        return None
+    stamp = [activities.get(activity_type, {}).get(field) for activity_type, field in fields]
+    return stamp if any(stamp) else None
+
+# Function to yield the items of a list newer than its watermark, newest first, yields nothing when it didn't change
+async def stream_new(name, url, fields, timestamp_key, initial, newest_first=True):
+    """
+    initial is the watermark used when the list was never processed, so the
+    first run doesn't post the whole history. newest_first=False is for lists
+    that aren't sorted by timestamp_key: they are requested unconditionally,
+    read to the last page and only filtered by the watermark.
+    Raises RequestError if a page failed. Nothing is remembered until the
+    caller calls mark_processed(), so an unprocessed change is seen again.
+    """
+    stamp = await get_activity_stamp(fields)
+    if stamp is not None and activity_seen.get(name) == stamp:
+        logger.debug(f'Trakt {name} unchanged according to the last activities')
+        return
+    watermark = watermarks.get(name) or initial
+    if newest_first:
+        # Lists sorted by date usually stop at the first page, so no pages are requested ahead for them
+        pages = paginate(url, headers=trakt_headers(), first_headers=conditional_headers(url), prefetch=0)
+    else:
+        # A new item can land on any page, an unchanged first page doesn't mean the list didn't change
+        pages = paginate(url, headers=trakt_headers(), prefetch=TRAKT_PREFETCH_PAGES)
+    page = 0
+    async for status, response_headers, data in pages:
+        if status == 304:
+            logger.debug(f'Trakt {name} not modified')
+            pending[name] = (url, None, stamp)
+            return
+        page += 1
+        if page == 1:
+            # Only the first page of a list sorted newest first is requested conditionally
+            first_page_headers = response_headers if newest_first else None
+        reached = False
+        for item in data:
+            # Items at the watermark itself are yielded again, the caller skips the ones it already posted
+            if item[timestamp_key] >= watermark:
+                yield item
+            elif newest_first:
+                reached = True
+                break
+        if reached:
+            await pages.aclose()
+            break
+    logger.debug(f'Read {page} page(s) of Trakt {name}')
+    pending[name] = (url, first_page_headers, stamp)
+
+# Function to remember that the items yielded by stream_new() were processed, up to the newest timestamp
+def mark_processed(name, newest=None):
+    url, headers, stamp = pending.pop(name, (None, None, None))
+    if headers is not None:
+        remember_validators(url, headers)
+    if stamp is not None:
+        activity_seen[name] = stamp
+    if newest is not None and newest > watermarks.get(name, ''):
+        watermarks[name] = newest
+        save_watermarks()
@@ -1,14 +1,10 @@
 from calendar import weekday
-import requests
 import json
 import re
 import os
 from datetime import datetime, timedelta
 
 from src.globals import (
-    TRAKT_CLIENT_ID, 
-    TMDB_API_KEY, 
-    TRAKT_USERNAME, 
     TRAKT_URL_RATINGS, 
     TRAKT_URL_USER, 
     TRAKT_ICON_URL, 
@@ -16,9 +12,20 @@ from src.globals import (
 )
 
 from .custom_logger import logger
+from .http_client import RequestError
+from .trakt_client import trakt_time
+from .trakt_poller import stream_new, mark_processed
+from .tmdb import get_details, get_episode_details
+from .trakt_comments import refresh_comment_index, get_user_comment
 
 processed_rating_embeds = set()
 
+# Ratings of this period are posted on the first run, later runs continue at the watermark
+INITIAL_RATING_WINDOW = timedelta(minutes=60)
+
+# Timestamps of the last activities that change when something is rated
+RATING_ACTIVITY = [(rating_type, 'rated_at') for rating_type in ['movies', 'shows', 'seasons', 'episodes']]
+
 def load_rating_processed_embeds():
     file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'json', 'processed_rating_embeds.json')
     try:
@@ -49,10 +56,10 @@ def convert_spoiler_tags(comment):
         comment = re.sub(pattern, spoiler_replacement, comment)
     return comment
 
-def format_rating_show_embed(show):
+async def format_rating_show_embed(show):
     trakt_link = f'[Trakt](https://trakt.tv/shows/{show["show"]["ids"]["trakt"]})'
     imdb_link = f'[IMDb](https://www.imdb.com/title/{show["show"]["ids"]["imdb"]})'
-    tmdb_details = get_tmdb_details('tv', show["show"]["ids"]["tmdb"])
+    tmdb_details = await get_details('tv', show["show"]["ids"]["tmdb"])
     if tmdb_details:
         thumbnail = f'https://image.tmdb.org/t/p/w500/{tmdb_details["poster_path"]}'
     else:
@@ -65,7 +72,7 @@ def format_rating_show_embed(show):
         {'name': 'User', 'value': TRAKT_URL_USER, 'inline': True},
         {'name': 'Links', 'value': f'{trakt_link} • {imdb_link}', 'inline': True}
     ]
-    user_comment = get_user_comment(TRAKT_USERNAME, show["show"]["ids"]["trakt"], 'show')
+    user_comment = get_user_comment('show', show["show"]["ids"]["trakt"])
     if user_comment:
         converted_comment = convert_spoiler_tags(user_comment['comment'])
         fields.append({'name': 'Comment', 'value': converted_comment, 'inline': False})
@@ -82,14 +89,14 @@ def format_rating_show_embed(show):
         'timestamp': timestamp
     }
 
-def format_rating_episode_embed(episode):
+async def format_rating_episode_embed(episode):
     trakt_link = f'[Trakt](https://trakt.tv/shows/{episode["show"]["ids"]["trakt"]}/seasons/{episode["episode"]["season"]}/episodes/{episode["episode"]["number"]})'
     imdb_link = f'[IMDb](https://www.imdb.com/title/{episode["episode"]["ids"]["imdb"]})' if episode["episode"]["ids"]["imdb"] else ''
-    tmdb_details = get_tmdb_details('tv', episode["show"]["ids"]["tmdb"])
+    tmdb_details = await get_details('tv', episode["show"]["ids"]["tmdb"])
     if tmdb_details:
         season_number = episode["episode"]["season"]
         episode_number = episode["episode"]["number"]
-        episode_tmdb_details = get_tmdb_episode_details(episode["show"]["ids"]["tmdb"], season_number, episode_number)
+        episode_tmdb_details = await get_episode_details(episode["show"]["ids"]["tmdb"], season_number, episode_number)
         if episode_tmdb_details:
             thumbnail = f'https://image.tmdb.org/t/p/w500/{tmdb_details["poster_path"]}'
     else:
@@ -102,7 +109,7 @@ def format_rating_episode_embed(episode):
         {'name': 'User', 'value': TRAKT_URL_USER, 'inline': True},
         {'name': 'Links', 'value': f'{trakt_link} • {imdb_link}' if imdb_link else trakt_link, 'inline': True}
     ]
-    user_comment = get_user_comment(TRAKT_USERNAME, episode["episode"]["ids"]["trakt"], 'episode')
+    user_comment = get_user_comment('episode', episode["episode"]["ids"]["trakt"])
     if user_comment:
         converted_comment = convert_spoiler_tags(user_comment['comment'])
         fields.append({'name': 'Comment', 'value': converted_comment, 'inline': False})
@@ -119,9 +126,9 @@ def format_rating_episode_embed(episode):
         'timestamp': timestamp
     }
 
-def format_rating_season_embed(season):
+async def format_rating_season_embed(season):
     trakt_link = f'[Trakt](https://trakt.tv/shows/{season["show"]["ids"]["trakt"]}/seasons/{season["season"]["number"]})'
-    tmdb_details = get_tmdb_details('tv', season["show"]["ids"]["tmdb"])
+    tmdb_details = await get_details('tv', season["show"]["ids"]["tmdb"])
     if tmdb_details:
         if 'seasons' in tmdb_details:
             season_offset = tmdb_details.get('season_number_offset', 0)
@@ -143,7 +150,7 @@ def format_rating_season_embed(season):
         {'name': 'User', 'value': TRAKT_URL_USER, 'inline': True},
         {'name': 'Links', 'value': trakt_link, 'inline': True}
     ]
-    user_comment = get_user_comment(TRAKT_USERNAME, season["season"]["ids"]["trakt"], 'season')
+    user_comment = get_user_comment('season', season["season"]["ids"]["trakt"])
     if user_comment:
         converted_comment = convert_spoiler_tags(user_comment['comment'])
         fields.append({'name': 'Comment', 'value': converted_comment, 'inline': False})
@@ -160,10 +167,10 @@ def format_rating_season_embed(season):
         'timestamp': timestamp
     }
 
-def format_rating_movie_embed(movie):
+async def format_rating_movie_embed(movie):
     trakt_link = f'[Trakt](https://trakt.tv/movies/{movie["movie"]["ids"]["trakt"]})'
     imdb_link = f'[IMDb](https://www.imdb.com/title/{movie["movie"]["ids"]["imdb"]})'
-    tmdb_details = get_tmdb_details('movie', movie["movie"]["ids"]["tmdb"])
+    tmdb_details = await get_details('movie', movie["movie"]["ids"]["tmdb"])
     if tmdb_details:
         thumbnail = f'https://image.tmdb.org/t/p/w500/{tmdb_details["poster_path"]}'
     else:
@@ -176,7 +183,7 @@ def format_rating_movie_embed(movie):
         {'name': 'User', 'value': TRAKT_URL_USER, 'inline': True},
         {'name': 'Links', 'value': f'{trakt_link} • {imdb_link}', 'inline': True}
     ]
-    user_comment = get_user_comment(TRAKT_USERNAME, movie["movie"]["ids"]["trakt"], 'movie')
+    user_comment = get_user_comment('movie', movie["movie"]["ids"]["trakt"])
     if user_comment:
         converted_comment = convert_spoiler_tags(user_comment['comment'])
         fields.append({'name': 'Comment', 'value': converted_comment, 'inline': False})
@@ -193,23 +200,6 @@ def format_rating_movie_embed(movie):
         'timestamp': timestamp
     }
     
-def get_user_comment(username, content_id, content_type):
-    comments_url = f'https://api.trakt.tv/users/{username}/comments'
-    headers = {
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': TRAKT_CLIENT_ID
-    }
-    response = requests.get(comments_url, headers=headers)
-    if response.status_code == 200:
-        comments = response.json()
-        for comment in comments:
-            if comment['type'] == content_type and comment[content_type]['ids']['trakt'] == content_id:
-                return comment['comment']
-    else:
-        logger.error(f'Request to {comments_url} returned status code {response.status_code}')
-    return None
-
 def get_color_from_rating(rating):
     if rating == 1:
         return 0xFF5733  # Orange Red
@@ -234,98 +224,73 @@ def get_color_from_rating(rating):
     else:
         return 0x808080  # Default color
 
+# Function to stream the ratings newer than the watermark, newest first
 def fetch_trakt_ratings():
-    headers = {
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': TRAKT_CLIENT_ID
-    }
-    response = requests.get(TRAKT_URL_RATINGS, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        logger.error(f'Failed to fetch Trakt ratings: {response.status_code}')
-        return []
-        
-def get_tmdb_details(media_type, tmdb_id):
-    url = f'https://api.themoviedb.org/3/{media_type}/{tmdb_id}?api_key={TMDB_API_KEY}'
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        logger.error(f'Failed to fetch TMDB details: {response.status_code}')
-        return None
-
-def get_tmdb_season_details(tmdb_id, season_number):
-    url = f'https://api.themoviedb.org/3/tv/{tmdb_id}/season/{season_number}?api_key={TMDB_API_KEY}'
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        logger.error(f'Failed to fetch TMDB season details: {response.status_code}')
-        return None
-        
-def get_tmdb_episode_details(tmdb_id, season_number, episode_number):
-    url = f'https://api.themoviedb.org/3/tv/{tmdb_id}/season/{season_number}/episode/{episode_number}?api_key={TMDB_API_KEY}'
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        logger.error(f'Failed to fetch TMDB episode details: {response.status_code}')
-        return None
+    # The first run starts at the last hour, not at the first rating ever
+    initial = trakt_time(datetime.utcnow() - INITIAL_RATING_WINDOW)
+    return stream_new('ratings', TRAKT_URL_RATINGS, RATING_ACTIVITY, 'rated_at', initial)
 
-def process_ratings(ratings):
-    current_time = datetime.utcnow()
-    time_limit = current_time - timedelta(minutes=60)
-    sorted_ratings = sorted(ratings, key=lambda x: x['rated_at'])
-
-    # Check if there are any new ratings
-    new_ratings = [rating for rating in reversed(sorted_ratings) if datetime.strptime(rating['rated_at'], '%Y-%m-%dT%H:%M:%S.%fZ') >= time_limit]
+async def process_ratings(ratings):
+    # Check if there are any new ratings, they arrive newest first
+    new_ratings = [rating async for rating in ratings]
     if not new_ratings:
+        mark_processed('ratings')
         return None  # No new ratings, so return None
 
-    # There are new ratings, so load the processed embeds
+    # There are new ratings, so load the processed embeds and the comments
     load_rating_processed_embeds()
+    await refresh_comment_index()
 
     embeds = []
+    ids = []
     for rating in new_ratings:
-        if len(embeds) >= 10:
-            break
         if rating['type'] == 'show':
             if rating['show']['ids']['trakt'] not in processed_rating_embeds:
-                embed = format_rating_show_embed(rating)
+                embed = await format_rating_show_embed(rating)
                 embeds.append(embed)
-                processed_rating_embeds.add(rating['show']['ids']['trakt'])
+                ids.append(rating['show']['ids']['trakt'])
         elif rating['type'] == 'episode':
             if rating['episode']['ids']['trakt'] not in processed_rating_embeds:
-                embed = format_rating_episode_embed(rating)
+                embed = await format_rating_episode_embed(rating)
                 embeds.append(embed)
-                processed_rating_embeds.add(rating['episode']['ids']['trakt'])
+                ids.append(rating['episode']['ids']['trakt'])
         elif rating['type'] == 'season':
             if rating['season']['ids']['trakt'] not in processed_rating_embeds:
-                embed = format_rating_season_embed(rating)
+                embed = await format_rating_season_embed(rating)
                 embeds.append(embed)
-                processed_rating_embeds.add(rating['season']['ids']['trakt'])
+                ids.append(rating['season']['ids']['trakt'])
         elif rating['type'] == 'movie':
             if rating['movie']['ids']['trakt'] not in processed_rating_embeds:
-                embed = format_rating_movie_embed(rating)
+                embed = await format_rating_movie_embed(rating)
                 embeds.append(embed)
-                processed_rating_embeds.add(rating['movie']['ids']['trakt'])
+                ids.append(rating['movie']['ids']['trakt'])
+    newest = max(rating['rated_at'] for rating in new_ratings)
     if embeds:
-        embeds = embeds[::-1]
+        # Nothing is remembered yet, mark_ratings_sent() is called once the embeds were sent
         data = {
-            'embeds': embeds
+            'embeds': embeds[::-1],
+            'ids': ids[::-1],
+            'newest': newest
         }
-        save_rating_processed_embeds()
         return data
+    mark_processed('ratings', newest)
     return None
 
-def trakt_ratings():
+# Function to remember the ratings whose embeds were sent, newest moves the watermark once all of them were sent
+def mark_ratings_sent(ids, newest=None):
+    if ids:
+        processed_rating_embeds.update(ids)
+        save_rating_processed_embeds()
+    if newest is not None:
+        mark_processed('ratings', newest)
+
+async def trakt_ratings():
     try:
-        ratings = fetch_trakt_ratings()
-        result = process_ratings(ratings)
+        result = await process_ratings(fetch_trakt_ratings())
         if result:
             logger.info(f'Found {len(result["embeds"])} new ratings')
         return result
+    except RequestError as e:
+        logger.error(f'Failed to fetch Trakt ratings: {e}')
     except Exception as e:
-        logger.error(f'Error occurred: {str(e)}')
\ No newline at end of file
+        logger.error(f'Error occurred: {str(e)}')
@@ -1,17 +1,15 @@
 from calendar import weekday
 import discord
-import requests
-import json
 from datetime import datetime, timedelta
 
 from src.globals import (
-    TRAKT_CLIENT_ID, 
-    TMDB_API_KEY, 
     TRAKT_USERNAME,
     DISCORD_THUMBNAIL
 )
 
 from src.custom_logger import logger
+from src.trakt_history import sync_history, history_between
+from src.tmdb import get_poster_path
 
 def get_dates():
     end_date = datetime.now()
@@ -23,24 +21,12 @@ def get_dates():
     end_date_str = end_date.strftime('%Y-%m-%dT%H:%M:%SZ')
     return start_date, end_date, week_number, year, start_date_str, end_date_str
 
-def get_history_data(headers, start_date_str, end_date_str):
-    page = 1
-    all_history_data = []
-    while True:
-        history_url = f"https://api.trakt.tv/users/{TRAKT_USERNAME}/history"
-        params = {
-            "start_at": start_date_str,
-            "end_at": end_date_str,
-            "page": page,
-            "limit": 100
-        }
-        history_response = requests.get(history_url, headers=headers, params=params)
-        history_data = json.loads(history_response.text)
-        if not history_data:
-            break
-        all_history_data.extend(history_data)
-        page += 1
-    return sorted(all_history_data, key=lambda x: x['watched_at'])
+# Function to get the plays of the report period, only the plays since the last sync are downloaded
+async def get_history_data(start_date_str, end_date_str):
+    await sync_history()
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%dT%H:%M:%SZ')
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%dT%H:%M:%SZ')
+    return history_between(start_date, end_date)
 
 def get_movie_count(sorted_history_data):
     movie_count = 0
@@ -57,64 +43,49 @@ def get_episode_counts(sorted_history_data):
             year = item['show']['year'] if item['show'].get('year') else ""
             episode_counts[show_title] = {
                 'count': episode_counts.get(show_title, {}).get('count', 0) + 1,
-                'year': year
+                'year': year,
+                'tmdb': item['show']['ids'].get('tmdb')
             }
     return episode_counts
 
-def get_poster_url(search_url, search_params):
-    search_response = requests.get(search_url, params=search_params)
-    search_data = json.loads(search_response.text)
-    if len(search_data["results"]) > 0:
-        poster_path = search_data["results"][0]["poster_path"]
+# Function to get the poster of the last item that has one, only that poster is shown as thumbnail
+async def get_last_poster_url(media_type, tmdb_ids):
+    for tmdb_id in reversed(tmdb_ids):
+        poster_path = await get_poster_path(media_type, tmdb_id)
         if poster_path:
-            poster_url = f"https://image.tmdb.org/t/p/w500{poster_path}"
-        else:
-            poster_url = None
-    else:
-        poster_url = None
-    return poster_url
+            return f"https://image.tmdb.org/t/p/w500{poster_path}"
+    return None
 
-def add_movie_fields_to_embed(movies_embed, sorted_history_data):
-    for item in sorted_history_data:
-        if item['type'] == 'movie':
-            movie_title = item['movie']['title']
-            year = item['movie']['year'] if item['movie'].get('year') else ""
-            watched_date = datetime.strptime(item['watched_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            search_url = "https://api.themoviedb.org/3/search/multi"
-            search_params = {
-                "api_key": TMDB_API_KEY,
-                "query": movie_title
-            }
-            poster_url = get_poster_url(search_url, search_params)
-            movies_embed.add_field(
-                name=f"{movie_title} ({year})",
-                value="",
-                inline=False
-            )
-            if poster_url:
-                movies_embed.set_thumbnail(url=poster_url)
+async def add_movie_fields_to_embed(movies_embed, sorted_history_data):
+    movies = [item for item in sorted_history_data if item['type'] == 'movie']
+    for item in movies:
+        movie_title = item['movie']['title']
+        year = item['movie']['year'] if item['movie'].get('year') else ""
+        movies_embed.add_field(
+            name=f"{movie_title} ({year})",
+            value="",
+            inline=False
+        )
+    poster_url = await get_last_poster_url('movie', [item['movie']['ids'].get('tmdb') for item in movies])
+    if poster_url:
+        movies_embed.set_thumbnail(url=poster_url)
     return movies_embed
 
-def add_episode_fields_to_embed(episodes_embed, episode_counts):
+async def add_episode_fields_to_embed(episodes_embed, episode_counts):
     for show_title, data in episode_counts.items():
         episode_count = data['count']
         year = data['year']
-        search_url = "https://api.themoviedb.org/3/search/tv"
-        search_params = {
-            "api_key": TMDB_API_KEY,
-            "query": show_title
-        }
-        poster_url = get_poster_url(search_url, search_params)
         episodes_embed.add_field(
             name=f"{show_title} ({year})",
             value=f"{episode_count} episode{'s' if episode_count != 1 else ''}",
             inline=False
         )
-        if poster_url:
-            episodes_embed.set_thumbnail(url=poster_url)
+    poster_url = await get_last_poster_url('tv', [data['tmdb'] for data in episode_counts.values()])
+    if poster_url:
+        episodes_embed.set_thumbnail(url=poster_url)
     return episodes_embed
 
-def create_movie_embed(sorted_history_data, start_date_str, end_date_str, week_number):
+async def create_movie_embed(sorted_history_data, start_date_str, end_date_str, week_number):
     movie_count = get_movie_count(sorted_history_data)
     movies_embed = discord.Embed(
         title=f"{movie_count} Movie{'s' if movie_count != 1 else ''} :clapper:", 
@@ -133,12 +104,12 @@ def create_movie_embed(sorted_history_data, start_date_str, end_date_str, week_n
     movies_embed.set_footer(text=timestamp)
     movies_embed.set_image(url=DISCORD_THUMBNAIL)
     if movie_count > 0:
-        movies_embed = add_movie_fields_to_embed(movies_embed, sorted_history_data)
+        movies_embed = await add_movie_fields_to_embed(movies_embed, sorted_history_data)
     else:
         movies_embed.description = "No movies watched this week."
     return movies_embed
 
-def create_episode_embed(sorted_history_data, start_date_str, end_date_str, week_number):
+async def create_episode_embed(sorted_history_data, start_date_str, end_date_str, week_number):
     episode_counts = get_episode_counts(sorted_history_data)
     total_episode_count = sum(item['count'] for item in episode_counts.values())
     episodes_embed = discord.Embed(
@@ -158,21 +129,16 @@ def create_episode_embed(sorted_history_data, start_date_str, end_date_str, week
     episodes_embed.set_footer(text=timestamp)
     episodes_embed.set_image(url=DISCORD_THUMBNAIL)
     if total_episode_count > 0:
-        episodes_embed = add_episode_fields_to_embed(episodes_embed, episode_counts)
+        episodes_embed = await add_episode_fields_to_embed(episodes_embed, episode_counts)
     else:
         episodes_embed.description = "No episodes watched this week."
     return episodes_embed
 
-def create_weekly_user_embed():
+async def create_weekly_user_embed():
     start_date_str, end_date_str, week_number, year, start_date_str, end_date_str = get_dates()
-    headers = {
-        "Content-Type": "application/json",
-        "trakt-api-version": "2",
-        "trakt-api-key": TRAKT_CLIENT_ID
-    }
-    sorted_history_data = get_history_data(headers, start_date_str, end_date_str)
-    movies_embed = create_movie_embed(sorted_history_data, start_date_str, end_date_str, week_number)
-    episodes_embed = create_episode_embed(sorted_history_data, start_date_str, end_date_str, week_number)
+    sorted_history_data = await get_history_data(start_date_str, end_date_str)
+    movies_embed = await create_movie_embed(sorted_history_data, start_date_str, end_date_str, week_number)
+    episodes_embed = await create_episode_embed(sorted_history_data, start_date_str, end_date_str, week_number)
     data = {
         'embeds': [movies_embed.to_dict(), episodes_embed.to_dict()]
     }
@@ -1,6 +1,20 @@
 from discord import Embed
 
+from .send_scheduler import MAX_EMBEDS_PER_MESSAGE, MAX_EMBED_CHARACTERS
+
 def split_embeds(embeds):
-    # Split the embeds into groups of 10
-    embed_groups = [embeds[i:i+10] for i in range(0, len(embeds), 10)]
-    return embed_groups
\ No newline at end of file
+    # Split the embeds into groups of 10, a group is closed early when its combined text would exceed Discord's limit
+    embed_groups = []
+    group = []
+    characters = 0
+    for embed in embeds:
+        size = len(Embed.from_dict(embed))
+        if group and (len(group) >= MAX_EMBEDS_PER_MESSAGE or characters + size > MAX_EMBED_CHARACTERS):
+            embed_groups.append(group)
+            group = []
+            characters = 0
+        group.append(embed)
+        characters += size
+    if group:
+        embed_groups.append(group)
+    return embed_groups
@@ -11,18 +11,18 @@ from .custom_logger import logger
 
 def create_watchtower_embed(data):
     logger.debug("Watchtower API Response: {}", data)
-    if data['message'].startswith('Watchtower'):
+    if data.message.startswith('Watchtower'):
         return create_checking_watchtower_embed(data)
-    elif data['message'][0].isdigit():
+    elif data.message[0].isdigit():
         return create_update_watchtower_embed(data)
 
 def create_checking_watchtower_embed(data):
     # Extract the version from the message
-    version = data['message'].split('\n')[0]
+    version = data.message.split('\n')[0]
 
     # Extract the message starting from "Checking all containers"
-    description_index = data['message'].index('Checking all containers')
-    description = data['message'][description_index:]
+    description_index = data.message.index('Checking all containers')
+    description = data.message[description_index:]
 
     # Wrap the description in code blocks
     description = f"```{description}```"
@@ -45,7 +45,7 @@ def create_checking_watchtower_embed(data):
 
 def create_update_watchtower_embed(data):
     # Split the message into lines
-    lines = data['message'].split('\n')
+    lines = data.message.split('\n')
 
     # Skip the first line and process the rest
     lines = lines[1:]
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from config import WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE
+
+from .custom_logger import logger
+
+"""
+Internal queue for incoming webhooks.
+
+The webhook handlers only validate the payload and put it on this queue, a pool
+of workers then builds the embeds and delivers them to Discord.
+"""
+
+webhook_queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+
+# Mapping of webhook source (e.g. 'sonarr') to the coroutine that processes its payload
+processors = {}
+
+workers = []
+
+# Function to register the coroutine that processes payloads of a webhook source
+def register_processor(source, processor):
+    processors[source] = processor
+
+# Function to queue a payload, returns False when the queue is full
+def enqueue(source, data):
+    try:
+        webhook_queue.put_nowait((source, data, time.monotonic()))
+        return True
+    except asyncio.QueueFull:
+        logger.warning(f"Webhook queue is full ({WEBHOOK_QUEUE_SIZE}), dropping {source} webhook")
+        return False
+
+# Function to get the current queue depth and pool size
+def queue_stats():
+    return {
+        'depth': webhook_queue.qsize(),
+        'max_depth': WEBHOOK_QUEUE_SIZE,
+        'workers': len(workers)
+    }
+
+async def worker(worker_id):
+    while True:
+        source, data, received = await webhook_queue.get()
+        try:
+            await processors[source](data)
+            logger.debug(f"Worker {worker_id} processed {source} webhook in {time.monotonic() - received:.3f}s")
+        except Exception as e:
+            logger.error(f"Error processing {source} webhook: {e}")
+        finally:
+            webhook_queue.task_done()
+
+# Function to start the worker pool, must be called from the running event loop
+def start_workers():
+    for worker_id in range(WEBHOOK_WORKERS):
+        workers.append(asyncio.create_task(worker(worker_id)))
+    logger.info(f"Started {WEBHOOK_WORKERS} webhook workers")